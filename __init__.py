@@ -10,9 +10,12 @@ from trytond.pool import Pool
 from .cms import (
     MenuItem, BannerCategory, Banner, ArticleCategory,
     Article, ArticleAttribute, Website, NereidStaticFile,
-    ArticleCategoryRelation,
+    ArticleCategoryRelation, ArticleRelated, ArticleURI, Translation,
+    ArticleArchive, ArticleNeighbor, ArticleView, ArticlePopular, BannerStat,
 )
 from user import NereidUser
+from artifact import Artifact, ArtifactJob
+from purge import Purge
 
 
 def register():
@@ -29,6 +32,17 @@ def register():
         NereidStaticFile,
         Website,
         ArticleCategoryRelation,
+        ArticleRelated,
+        ArticleURI,
+        Translation,
+        ArticleArchive,
+        ArticleNeighbor,
+        ArticleView,
+        ArticlePopular,
+        BannerStat,
         NereidUser,
+        Artifact,
+        ArtifactJob,
+        Purge,
         module='nereid_cms', type_='model'
     )
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Artifacts
+    artifact.py
+
+    Expensive derived content (rendered article HTML, atom feeds, sitemaps)
+    is generated by a background job queue and stored as artifacts, so that
+    request handlers only read finished documents.
+
+'''
+import time
+import logging
+import threading
+import traceback
+from collections import defaultdict
+
+from nereid import abort, Response
+from trytond import backend
+from trytond.model import ModelSQL, fields
+from trytond.pool import Pool, PoolMeta
+from trytond.transaction import Transaction
+
+from .cms import _chunks
+from .singleflight import single_flight, discard
+
+__all__ = ['Artifact', 'ArtifactJob']
+__metaclass__ = PoolMeta
+
+logger = logging.getLogger('nereid_cms.artifact')
+
+# Jobs requested by the requests of the process which missed their artifact,
+# per database, until the artifact worker queues them
+_requested = defaultdict(dict)
+_requested_lock = threading.Lock()
+
+
+class Artifact(ModelSQL):
+    "CMS Generated Artifact"
+    __name__ = 'nereid.cms.artifact'
+
+    key = fields.Char('Key', required=True, select=True)
+    resource = fields.Char(
+        'Resource', select=True,
+        help='The record (model,id) the artifact was generated from.'
+    )
+    content = fields.Text('Content')
+
+    #: Seconds after which clients are told to ask again for an artifact
+    #: being generated
+    _retry_after = 10
+
+    @classmethod
+    def __setup__(cls):
+        super(Artifact, cls).__setup__()
+        cls._sql_constraints += [
+            ('key_uniq', 'UNIQUE(key)', 'The key of an artifact is unique.'),
+        ]
+
+    @classmethod
+    def get_content(cls, key):
+        """
+        Return the content of the artifact with the given key or None if it
+        has not been generated (yet)
+        """
+        artifacts = cls.search([('key', '=', key)], limit=1)
+        return artifacts[0].content if artifacts else None
+
+    @classmethod
+    def get_or_queue(cls, key, job):
+        """
+        Return the content of the artifact with the given key. If it has not
+        been generated yet, the job generating it is requested and the
+        request is answered with a 503 telling the client when to retry: the
+        document is never built on the request thread.
+        """
+        Job = Pool().get('nereid.cms.artifact.job')
+
+        content = cls.get_content(key)
+        if content is None:
+            Job.request([job])
+            abort(Response(
+                'The document is being generated', 503,
+                headers={'Retry-After': str(cls._retry_after)},
+                mimetype='text/plain',
+            ))
+        return content
+
+    @staticmethod
+    def _flight_key(key):
+        # The copies of the documents are shared by the databases of the host
+        return u'%s:%s' % (Transaction().cursor.database_name, key)
+
+    @classmethod
+    def generate(cls, key, build, resource=None):
+        """
+        Store the document returned by `build()` as the artifact with the
+        given key. Workers running the job of the key at the same time build
+        the document once, see `single_flight`.
+        """
+        cls.store(
+            key, single_flight(cls._flight_key(key), build), resource=resource
+        )
+
+    @classmethod
+    def store(cls, key, content, resource=None):
+        """
+        Create or replace the artifact with the given key
+        """
+        artifacts = cls.search([('key', '=', key)], limit=1)
+        if artifacts:
+            cls.write(artifacts, {'content': content, 'resource': resource})
+        else:
+            cls.create([{
+                'key': key, 'content': content, 'resource': resource,
+            }])
+        # The next jobs of the key build the document again
+        discard(cls._flight_key(key))
+
+    @classmethod
+    def invalidate(cls, resources):
+        """
+        Delete the artifacts generated from the given resources
+        """
+        if resources:
+            artifacts = cls.search([('resource', 'in', list(resources))])
+            cls.delete(artifacts)
+            for artifact in artifacts:
+                discard(cls._flight_key(artifact.key))
+
+
+class ArtifactJob(ModelSQL):
+    "CMS Artifact Generation Job"
+    __name__ = 'nereid.cms.artifact.job'
+    _order = [('id', 'ASC')]
+
+    key = fields.Char('Key', required=True, select=True)
+    model = fields.Char('Model', required=True)
+    method = fields.Char('Method', required=True)
+    record = fields.Integer('Record')
+    needs_request = fields.Boolean(
+        'Needs Request', select=True,
+        help='The job builds URLs and must run in a request context.'
+    )
+    language = fields.Char(
+        'Language', help='The language of the documents the job builds.'
+    )
+    attempts = fields.Integer('Attempts', required=True, select=True)
+    error = fields.Text('Error')
+
+    #: Number of failed runs after which a job is left aside
+    _max_attempts = 5
+
+    @staticmethod
+    def default_needs_request():
+        return False
+
+    @staticmethod
+    def default_attempts():
+        return 0
+
+    @staticmethod
+    def _website_languages():
+        """
+        Return the codes of the languages the websites are served in
+        """
+        Website = Pool().get('nereid.website')
+
+        languages = set()
+        for website in Website.search([]):
+            languages.update(
+                locale.language.code
+                for locale in website.locales or [website.default_locale]
+            )
+        return languages
+
+    @classmethod
+    def enqueue(cls, jobs):
+        """
+        Queue the given jobs (dictionaries with the values of the fields) in
+        one batch, skipping the ones whose key is already queued.
+
+        Jobs needing a request context are queued once for every language
+        of the websites, since the documents they build are stored per
+        language.
+
+        Keys are not unique in the table: concurrent transactions may queue
+        the same job, which is then only run once.
+        """
+        languages = None
+        expanded = {}
+        for job in jobs:
+            if job.get('needs_request') and not job.get('language'):
+                if languages is None:
+                    languages = cls._website_languages()
+                for language in languages:
+                    key = u'%s:%s' % (job['key'], language)
+                    expanded[key] = dict(job, key=key, language=language)
+            else:
+                expanded[job['key']] = job
+        if not expanded:
+            return
+        queued = set()
+        cursor = Transaction().cursor
+        for keys in _chunks(expanded.keys(), cursor.IN_MAX):
+            queued.update(
+                job.key for job in cls.search([('key', 'in', keys)])
+            )
+        to_create = [
+            values for values in expanded.itervalues()
+            if values['key'] not in queued
+        ]
+        if to_create:
+            cls.create(to_create)
+
+    @classmethod
+    def request(cls, jobs):
+        """
+        Note jobs requested by a request, which may be read only, to be
+        queued by the artifact worker of the process
+        """
+        database_name = Transaction().cursor.database_name
+        with _requested_lock:
+            _requested[database_name].update(
+                (job['key'], job) for job in jobs
+            )
+
+    @classmethod
+    def enqueue_requested(cls):
+        """
+        Queue the jobs requested by the requests of the process
+        """
+        database_name = Transaction().cursor.database_name
+        with _requested_lock:
+            jobs = _requested.pop(database_name, {})
+        cls.enqueue(jobs.values())
+
+    def run(self):
+        """
+        Call the method of the job with the record of the job if any
+        """
+        Model = Pool().get(self.model)
+        method = getattr(Model, self.method)
+        if self.record is not None:
+            return method(self.record)
+        return method()
+
+    def _run_in_websites(self, app, websites):
+        """
+        Run the job in a request context of every website served in the
+        language of the job
+        """
+        with Transaction().set_context(language=self.language):
+            for website in websites:
+                locales = [
+                    locale for locale in
+                    website.locales or [website.default_locale]
+                    if locale.language.code == self.language
+                ]
+                if not locales:
+                    continue
+                # Websites with locales serve their pages under the code
+                path = '/%s/' % locales[0].code if website.locales else '/'
+                with app.test_request_context(
+                        path, base_url='http://%s/' % website.name):
+                    self.run()
+
+    @classmethod
+    def _run_isolated(cls, function):
+        """
+        Call the function and return the traceback of the exception it
+        raised, if any. On PostgreSQL the call is wrapped in a savepoint, so
+        that a failed statement does not abort the other jobs of the
+        transaction.
+        """
+        cursor = Transaction().cursor
+        savepoint = backend.name() == 'postgresql'
+        if savepoint:
+            cursor.execute('SAVEPOINT nereid_cms_artifact_job')
+        try:
+            function()
+        except Exception:
+            if savepoint:
+                cursor.execute(
+                    'ROLLBACK TO SAVEPOINT nereid_cms_artifact_job'
+                )
+            logger.exception('Artifact job failed')
+            return traceback.format_exc()
+        if savepoint:
+            cursor.execute('RELEASE SAVEPOINT nereid_cms_artifact_job')
+
+    @classmethod
+    def run_pending(cls, app=None, limit=100):
+        """
+        Run up to `limit` pending jobs, the jobs which failed the least first.
+
+        Jobs that need a request context are only run when a nereid
+        application is given, once for every website, since the documents
+        they generate contain absolute URLs. The cron, which has no
+        application, leaves them to a worker started with
+        `start_artifact_worker`.
+
+        Each job runs on its own: a job which fails is kept with its error
+        and tried again by the next runs, until it failed `_max_attempts`
+        times.
+        """
+        Website = Pool().get('nereid.website')
+
+        domain = [('attempts', '<', cls._max_attempts)]
+        if app is None:
+            domain.append(('needs_request', '=', False))
+        jobs = cls.search(
+            domain, limit=limit, order=[('attempts', 'ASC'), ('id', 'ASC')]
+        )
+
+        websites = Website.search([]) if app is not None else []
+        by_key = {}
+        for job in jobs:
+            by_key.setdefault(job.key, []).append(job)
+
+        done = []
+        for job in jobs:
+            if job.key not in by_key:
+                continue
+            same = by_key.pop(job.key)
+            if job.needs_request:
+                error = cls._run_isolated(
+                    lambda: job._run_in_websites(app, websites)
+                )
+            else:
+                error = cls._run_isolated(job.run)
+            if error is None:
+                done.extend(same)
+            else:
+                for failed in same:
+                    cls.write([failed], {
+                        'attempts': failed.attempts + 1,
+                        'error': error,
+                    })
+        cls.delete(done)
+        return len(done)
+
+    @classmethod
+    def run_pending_cron(cls):
+        """
+        Entry point of the cron: runs the jobs not needing a request context
+        """
+        cls.run_pending()
+
+
+def start_artifact_worker(app, database_name, user, interval=10):
+    """
+    Start a daemon thread running the pending artifact jobs of the database
+    every `interval` seconds, with the given nereid application so that feed
+    and sitemap jobs can be run too.
+
+    Call it once at worker boot: the jobs requested by the requests of the
+    worker which missed their artifact are only queued by it. Each run uses
+    its own transaction, which is committed once the jobs it ran are
+    deleted from the queue.
+    """
+    def work():
+        while True:
+            try:
+                with Transaction().start(database_name, user) as transaction:
+                    Job = Pool(database_name).get('nereid.cms.artifact.job')
+                    Job.enqueue_requested()
+                    Job.run_pending(app)
+                    transaction.cursor.commit()
+            except Exception:
+                logger.exception('Artifact generation failed')
+            time.sleep(interval)
+
+    thread = threading.Thread(target=work, name='nereid-cms-artifacts')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -5,10 +5,23 @@
 
 
 '''
+import os
+import re
+import logging
+import mimetypes
+import urllib2
+from urlparse import urlparse
 import time
+import json
+import csv
+from math import sqrt
+from collections import Counter
+from itertools import islice, chain
 from string import Template
 import pytz
-from datetime import datetime
+import heapq
+import random
+from datetime import datetime, date, timedelta
 
 from nereid import context_processor
 from nereid import (
@@ -21,30 +34,224 @@ from nereid.contrib.sitemap import SitemapIndex, SitemapSection
 from werkzeug.utils import secure_filename
 from werkzeug.contrib.atom import AtomFeed
 from nereid.ctx import has_request_context
+from lxml import etree
 
 from trytond.pyson import Eval, Not, Equal, In
 from trytond.model import ModelSQL, ModelView, fields, Workflow
 from trytond.transaction import Transaction
 from trytond.pool import Pool, PoolMeta
 from trytond import backend
-
-try:
-    from docutils.core import publish_parts
-except ImportError:
-    publish_parts = None
-
-try:
-    from markdown import markdown
-except ImportError:
-    markdown = None
+from trytond.config import config
+from trytond.cache import Cache
+from sql import Null
+from sql.operators import Exists
+from sql.aggregate import Count, Sum
+from sql.functions import CurrentTimestamp
+
+from .purge import note_surrogate_keys, surrogate_response
+from .preload import note_preload, add_preload_links
+from .renderer import available_renderers, get_renderer
+from .counter import BufferedCounter
+from .replica import read_replica
+from .templating import clear_fragments
 
 __all__ = [
     'MenuItem', 'BannerCategory', 'Banner', 'Website',
     'ArticleCategory', 'Article', 'ArticleAttribute', 'NereidStaticFile',
-    'ArticleCategoryRelation',
+    'ArticleCategoryRelation', 'ArticleRelated', 'ArticleURI', 'Translation',
+    'ArticleArchive', 'ArticleNeighbor', 'ArticleView', 'ArticlePopular',
+    'BannerStat',
 ]
 __metaclass__ = PoolMeta
 
+logger = logging.getLogger('nereid_cms')
+
+
+def _chunks(iterable, size):
+    """
+    Yield successive lists of at most `size` items from the iterable
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def _migrate_in_batches(table, where, migrate, name, batch_size=None):
+    """
+    Run a data migration on the rows of the table matching `where`, in
+    batches of `batch_size` ids (the `migration_batch_size` option of the
+    `nereid_cms` configuration section, 10000 by default) committed one by
+    one, so that upgrades of large databases hold short locks.
+
+    `migrate(where)` is called with the condition selecting the rows of the
+    batch. The rows it migrates must no longer match `where`, so that an
+    interrupted migration resumes with the rows left when run again.
+    """
+    cursor = Transaction().cursor
+    if batch_size is None:
+        batch_size = config.getint(
+            'nereid_cms', 'migration_batch_size', default=10000
+        )
+
+    last_id, migrated = 0, 0
+    while True:
+        cursor.execute(*table.select(
+            table.id, where=where & (table.id > last_id),
+            order_by=[table.id.asc], limit=batch_size
+        ))
+        ids = [row[0] for row in cursor.fetchall()]
+        if not ids:
+            break
+        migrate(where & (table.id >= ids[0]) & (table.id <= ids[-1]))
+        cursor.commit()
+        last_id = ids[-1]
+        migrated += len(ids)
+        logger.info('%s: %d rows migrated', name, migrated)
+
+
+def _request_artifact_key(*parts):
+    """
+    Return the key of an artifact generated for the website and language of
+    the current request
+    """
+    return u':'.join(
+        map(unicode, parts) +
+        [request.nereid_website.name, Transaction().language]
+    )
+
+
+def _sitemap_xml(sitemap_section):
+    """
+    Return the XML document of a sitemap section as a string
+    """
+    return u''.join(chain(
+        [
+            u'<?xml version="1.0" encoding="UTF-8"?>\n',
+            u'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n',
+        ],
+        (etree.tostring(node) + u'\n' for node in sitemap_section),
+        [u'</urlset>'],
+    ))
+
+
+def _term_vector(text):
+    """
+    Return the term frequencies of the text and the norm of that vector
+    """
+    terms = Counter(re.findall(r'\w+', (text or u'').lower(), re.UNICODE))
+    return terms, sqrt(sum(count * count for count in terms.itervalues()))
+
+
+def _cosine_similarity(vector_a, vector_b):
+    """
+    Cosine similarity of two vectors returned by `_term_vector`
+    """
+    (terms_a, norm_a), (terms_b, norm_b) = vector_a, vector_b
+    if not norm_a or not norm_b:
+        return 0.0
+    if len(terms_a) > len(terms_b):
+        terms_a, terms_b = terms_b, terms_a
+    dot = sum(
+        count * terms_b.get(term, 0) for term, count in terms_a.iteritems()
+    )
+    return dot / (norm_a * norm_b)
+
+
+def _alias_table(weights):
+    """
+    Build the alias table (Vose's method) of the discrete distribution of
+    the weights: a list of probabilities and a list of aliases, so that an
+    index is drawn in constant time by `_alias_pick`
+    """
+    count = len(weights)
+    total = float(sum(weights))
+    scaled = [weight * count / total for weight in weights]
+    probabilities, aliases = [1.0] * count, range(count)
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        probabilities[less], aliases[less] = scaled[less], more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    return probabilities, aliases
+
+
+def _alias_pick(probabilities, aliases):
+    """
+    Draw an index from an alias table built by `_alias_table`
+    """
+    index = random.randrange(len(probabilities))
+    if random.random() < probabilities[index]:
+        return index
+    return aliases[index]
+
+
+def _immutable(self, *args, **kwargs):
+    raise TypeError('Menu nodes are immutable')
+
+
+class MenuNode(dict):
+    """
+    Immutable serialized menu item, as returned by `get_menu_item`.
+
+    Nodes only hold strings and their children, so menus can be cached,
+    pickled and serialized to JSON without ORM records. The record of a
+    `record` node is loaded from its reference when it is accessed by key or
+    attribute, while `items()`, `values()` and the JSON serialization give
+    the reference (`model,id`). Nodes are the read only dictionaries menu
+    items used to be (`node['title']`, `node.get(...)`, `for key in node`,
+    `node|tojson`) and expose their keys as attributes too.
+    """
+    __slots__ = ()
+
+    #: Keys of the nodes, the ones left to None are omitted
+    _keys = ('title', 'link', 'target', 'type_', 'children', 'record')
+
+    def __init__(
+            self, title, link=None, target=None, type_=None, children=None,
+            record=None):
+        values = zip(self._keys, (
+            title, link, target, type_,
+            tuple(children) if children is not None else None,
+            str(record) if record is not None else None,
+        ))
+        super(MenuNode, self).__init__(
+            (key, value) for key, value in values if value is not None
+        )
+
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Menu nodes are immutable')
+
+    def __getattr__(self, name):
+        if name not in self._keys:
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __reduce__(self):
+        return (self.__class__, tuple(
+            dict.get(self, key) for key in self._keys
+        ))
+
+    def __getitem__(self, key):
+        value = super(MenuNode, self).__getitem__(key)
+        if key == 'record':
+            model, id_ = value.split(',')
+            return Pool().get(model)(int(id_))
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __repr__(self):
+        return '<MenuNode %r>' % self.title
+
 
 class CMSMenuItemMixin(object):
     "Basic Mixin for cms menu item"
@@ -65,7 +272,7 @@ class CMSMenuItemMixin(object):
 
     def get_menu_item(self, max_depth):
         """
-        Return huge dictionary with serialized menu item
+        Return a MenuNode with the serialized menu item
 
         {
             title: <display name>,
@@ -83,7 +290,188 @@ class CMSMenuItemMixin(object):
         )
 
 
-class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
+class ScheduledTransitionMixin(object):
+    """
+    Mixin for workflow records which can be published and archived at a
+    scheduled time by the cron
+    """
+    publish_at = fields.DateTime('Publish At', select=True)
+    archive_at = fields.DateTime('Archive At', select=True)
+
+    @classmethod
+    def _due(cls, field, state, now):
+        """
+        Return the records whose scheduled time for the state has passed and
+        which have a transition to it
+        """
+        return cls.search([
+            (field, '<=', now),
+            ('state', 'in', [f for f, t in cls._transitions if t == state]),
+        ])
+
+    @classmethod
+    def run_scheduled_transitions(cls):
+        """
+        Publish and archive the records whose scheduled time has passed.
+
+        All the records due in this tick go through the transition as one
+        batch, so they are written (and caches invalidated) once per model
+        instead of once per record. The schedule is cleared, in one more
+        write, on the records which went through the transition.
+        """
+        now = datetime.utcnow()
+
+        cleared = []
+        for field, state, transition in [
+                ('publish_at', 'published', cls.publish),
+                ('archive_at', 'archived', cls.archive)]:
+            records = cls._due(field, state, now)
+            if not records:
+                continue
+            transition(records)
+            done = [
+                r for r in cls.browse(map(int, records)) if r.state == state
+            ]
+            if done:
+                cleared.extend([done, {field: None}])
+        if cleared:
+            cls.write(*cleared)
+
+
+class TranslationPrefetchMixin(object):
+    """
+    Mixin for models with translated fields which are rendered as lists
+    """
+
+    @classmethod
+    def prefetch_translations(cls, records):
+        """
+        Load the translations of every translated field of the records in the
+        language of the transaction with one `ir.translation` query, and
+        store them in the in-memory translation cache that `read` looks up.
+
+        Lists of records (category pages, feeds, menus, banner strips) are
+        then rendered without a translation query per field and batch of
+        records.
+        """
+        pool = Pool()
+        Translation = pool.get('ir.translation')
+        cursor = Transaction().cursor
+        language = Transaction().language
+        translation = Translation.__table__()
+
+        ids = list(set(map(int, records)))
+        names = [
+            '%s,%s' % (cls.__name__, name)
+            for name, field in cls._fields.iteritems()
+            if getattr(field, 'translate', False)
+        ]
+        if not ids or not names:
+            return
+
+        # Missing translations are cached as False, like get_ids does
+        values = dict(
+            ((name, res_id), False) for name in names for res_id in ids
+        )
+        for sub_ids in _chunks(ids, cursor.IN_MAX):
+            cursor.execute(*translation.select(
+                translation.name, translation.res_id, translation.value,
+                where=(translation.lang == language) &
+                (translation.type == 'model') &
+                translation.name.in_(names) &
+                translation.res_id.in_(sub_ids) &
+                (translation.value != Null) & (translation.value != '') &
+                (translation.fuzzy == False)  # noqa
+            ))
+            for name, res_id, value in cursor.fetchall():
+                values[(name, res_id)] = value
+
+        # Under the key `get_ids` uses
+        for (name, res_id), value in values.iteritems():
+            Translation._translation_cache.set(
+                (language, 'model', name, res_id), value
+            )
+
+
+class SurrogateKeyMixin(object):
+    """
+    Mixin for models whose records are rendered in cacheable responses.
+
+    Responses are tagged with the surrogate keys of the records they were
+    rendered from, and writing those records queues the purge of their keys
+    (see `purge.py`).
+    """
+
+    @property
+    def surrogate_key(self):
+        return '%s-%d' % (self.__name__.replace('.', '-'), self.id)
+
+    @classmethod
+    def list_surrogate_key(cls):
+        """
+        Key of the responses listing records of the model (feeds, sitemaps)
+        """
+        return '%s-list' % cls.__name__.replace('.', '-')
+
+    def get_surrogate_keys(self):
+        """
+        Return the keys of the responses to purge when the record changes
+        """
+        return [self.surrogate_key, self.list_surrogate_key()]
+
+    @classmethod
+    def queue_purge(cls, records):
+        """
+        Queue the purge of the surrogate keys of the records and drop the
+        cached fragments depending on the model
+        """
+        Purge = Pool().get('nereid.cms.purge')
+
+        if records:
+            clear_fragments([cls.__name__])
+        Purge.queue(chain.from_iterable(
+            record.get_surrogate_keys() for record in records
+        ))
+
+    @classmethod
+    def _purge_written(cls, args):
+        """
+        Queue the purge of the records of the arguments of `write`
+        """
+        actions = iter(args)
+        cls.queue_purge(list(chain.from_iterable(
+            records for records, _ in zip(actions, actions)
+        )))
+
+
+class CMSSitemapSection(SitemapSection):
+    """
+    Sitemap section which reads the records of the section with one search,
+    so the fields used to build their URL and last modification date are
+    loaded for all of them at once instead of record by record
+    """
+
+    def __iter__(self):
+        domain = [('id', '>', self.min_id), ('id', '<=', self.max_id)]
+        for record in self.model.search(domain + self.domain):
+            yield self.get_url_xml(record)
+
+
+class CMSPagination(Pagination):
+    """
+    Pagination which searches the records of the page only once, so that
+    they can be prepared before the template iterates over them
+    """
+
+    def items(self):
+        if not hasattr(self, '_items'):
+            self._items = super(CMSPagination, self).items()
+        return self._items
+
+
+class MenuItem(
+        ModelSQL, ModelView, CMSMenuItemMixin, TranslationPrefetchMixin,
+        SurrogateKeyMixin):
     "Nereid CMS Menuitem"
     __name__ = 'nereid.cms.menuitem'
     _rec_name = 'title'
@@ -140,19 +528,22 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
         if table.column_exist('reference'):  # pragma: no cover
             table.not_null_action('unique_name', 'remove')
 
+            # The value of type depends on existence of record
+            _migrate_in_batches(
+                sql_table,
+                (sql_table.reference != Null) & (sql_table.type_ != 'record'),
+                lambda where: cursor.execute(*sql_table.update(
+                    columns=[sql_table.type_], values=['record'], where=where
+                )),
+                'Menu item types'
+            )
+
             # Delete the newly created record column
             table.drop_column('record')
 
             # Rename the reference column as record
             table.column_rename('reference', 'record', True)
 
-            # The value of type depends on existence of record
-            cursor.execute(*sql_table.update(
-                columns=[sql_table.type_],
-                values=['record'],
-                where=(sql_table.record != None)  # noqa
-            ))
-
     @classmethod
     def allowed_models(cls):
         return [
@@ -191,6 +582,29 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
         super(MenuItem, cls).validate(menus)
         cls.check_recursion(menus)
 
+    @classmethod
+    def create(cls, vlist):
+        menus = super(MenuItem, cls).create(vlist)
+        cls.queue_purge(menus)
+        return menus
+
+    @classmethod
+    def write(cls, *args):
+        cls._purge_written(args)
+        super(MenuItem, cls).write(*args)
+        cls._purge_written(args)
+
+    @classmethod
+    def delete(cls, menus):
+        cls.queue_purge(menus)
+        super(MenuItem, cls).delete(menus)
+
+    def get_surrogate_keys(self):
+        keys = [self.surrogate_key]
+        if self.parent:
+            keys.append(self.parent.surrogate_key)
+        return keys
+
     def get_rec_name(self, name):
         def _name(menuitem):
             if menuitem.parent:
@@ -201,7 +615,7 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
 
     def get_menu_item(self, max_depth):
         """
-        Return huge dictionary with serialized menu item
+        Return a MenuNode with the serialized menu item
 
         {
             title: <display name>,
@@ -214,26 +628,23 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
             record: <instance of record>  # if type_ is `record`
         }
         """
-        res = {
-            'title': self.title,
-            'target': self.target,
-            'type_': self.type_,
-        }
+        note_surrogate_keys([self.surrogate_key])
+        link = record = children = None
         if self.type_ == 'static':
-            res['link'] = self.link
+            link = self.link
 
         if self.type_ == 'record':
-            res['record'] = self.record
-            res['link'] = self.record.get_absolute_url()
+            record = self.record
+            link = self.record.get_absolute_url()
 
         if max_depth:
-            res['children'] = self.get_children(max_depth=max_depth - 1)
+            children = self.get_children(max_depth=max_depth - 1)
 
-        if self.type_ == 'record' and not res.get('children') and max_depth:
-            res['children'] = self.record.get_children(
-                max_depth=max_depth - 1
-            )
-        return res
+        if self.type_ == 'record' and not children and max_depth:
+            children = self.record.get_children(max_depth=max_depth - 1)
+        return MenuNode(
+            self.title, link, self.target, self.type_, children, record
+        )
 
     def get_children(self, max_depth):
         """
@@ -243,6 +654,7 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
             ('parent', '=', self.id),
             ('active', '=', True)
         ])
+        self.prefetch_translations(children)
         return [
             child.get_menu_item(max_depth=max_depth - 1) for child in children
         ]
@@ -256,7 +668,7 @@ class MenuItem(ModelSQL, ModelView, CMSMenuItemMixin):
         return self.link
 
 
-class BannerCategory(ModelSQL, ModelView):
+class BannerCategory(ModelSQL, ModelView, SurrogateKeyMixin):
     """Collection of related Banners"""
     __name__ = 'nereid.cms.banner.category'
 
@@ -272,6 +684,64 @@ class BannerCategory(ModelSQL, ModelView):
         ), 'get_published_banners'
     )
 
+    #: Weights and alias tables of the published banners of the
+    #: categories, built on first use after any banner is written
+    _sampler_cache = Cache('nereid.cms.banner.sampler', context=False)
+
+    def get_sampler(self):
+        """
+        Return the ids of the published banners of the category, their
+        weights and the alias table of the weights
+        """
+        sampler = self._sampler_cache.get(self.id)
+        if sampler is None:
+            Banner = Pool().get('nereid.cms.banner')
+            banners = Banner.search([
+                ('state', '=', 'published'),
+                ('category', '=', self.id),
+                ('weight', '>', 0),
+            ])
+            weights = [banner.weight for banner in banners]
+            sampler = self._sampler_cache.set(self.id, (
+                [banner.id for banner in banners], weights,
+            ) + _alias_table(weights))
+        return sampler
+
+    def pick_banners(self, count=1):
+        """
+        Return `count` distinct published banners of the category drawn at
+        random in proportion to their weight, without database access once
+        the sampler of the category is built
+        """
+        Banner = Pool().get('nereid.cms.banner')
+
+        ids, weights, probabilities, aliases = self.get_sampler()
+        if count >= len(ids):
+            picked = list(ids)
+            random.shuffle(picked)
+            return Banner.browse(picked)
+        # Draws of the alias table are repeated until they give distinct
+        # banners, which samples without replacement in proportion to the
+        # weights in O(count) draws unless a few banners outweigh the others
+        picked, seen = [], set()
+        for _ in xrange(4 * count):
+            index = _alias_pick(probabilities, aliases)
+            if index not in seen:
+                seen.add(index)
+                picked.append(index)
+                if len(picked) == count:
+                    break
+        else:
+            # The heaviest banners keep being drawn again: the others are
+            # the remaining banners with the largest random keys
+            # (Efraimidis-Spirakis)
+            picked.extend(heapq.nlargest(
+                count - len(picked),
+                (i for i in xrange(len(ids)) if i not in seen),
+                key=lambda i: random.random() ** (1.0 / weights[i])
+            ))
+        return Banner.browse([ids[i] for i in picked])
+
     @classmethod
     @context_processor('get_banner_category')
     def get_banner_category(cls, uri, silent=True):
@@ -283,6 +753,10 @@ class BannerCategory(ModelSQL, ModelView):
         ], limit=1)
         if not category and not silent:
             raise RuntimeError("Banner category %s not found" % uri)
+        if category:
+            Banner = Pool().get('nereid.cms.banner')
+            Banner.prefetch_translations(category[0].banners)
+            note_surrogate_keys([category[0].surrogate_key])
         return category[0] if category else None
 
     def get_published_banners(self, name):
@@ -300,12 +774,14 @@ class BannerCategory(ModelSQL, ModelView):
         return res
 
 
-class Banner(Workflow, ModelSQL, ModelView):
+class Banner(
+        Workflow, ModelSQL, ModelView, ScheduledTransitionMixin,
+        TranslationPrefetchMixin, SurrogateKeyMixin):
     """Banner for CMS."""
     __name__ = 'nereid.cms.banner'
 
     name = fields.Char('Name', required=True, select=True)
-    description = fields.Text('Description')
+    description = fields.Text('Description', loading='lazy')
     category = fields.Many2One(
         'nereid.cms.banner.category', 'Category', required=True, select=True
     )
@@ -331,6 +807,22 @@ class Banner(Workflow, ModelSQL, ModelView):
             'invisible': Not(Equal(Eval('type'), 'remote_image'))
         }
     )
+    cache_remote_image = fields.Boolean(
+        'Cache Remote Image', states={
+            'invisible': Not(Equal(Eval('type'), 'remote_image'))
+        }, help='Serve a copy of the remote image, stored in the CMS static '
+        'folder of the website and refreshed in the background.'
+    )
+    cached_image = fields.Many2One(
+        'nereid.static.file', 'Cached Image', readonly=True,
+        ondelete='SET NULL', states={
+            'invisible': Not(Equal(Eval('type'), 'remote_image'))
+        }
+    )
+    cached_image_etag = fields.Char('Cached Image ETag', readonly=True)
+    cached_image_modified = fields.Char(
+        'Cached Image Last Modified', readonly=True
+    )
     custom_code = fields.Text(
         'Custom Code', translate=True,
         states={
@@ -371,6 +863,29 @@ class Banner(Workflow, ModelSQL, ModelView):
             ('archived', 'Archived')
     ], 'State', required=True, select=True, readonly=True)
     reference = fields.Reference('Reference', selection='allowed_models')
+    weight = fields.Integer(
+        'Weight', required=True,
+        help='Relative frequency of the banner in rotations.'
+    )
+
+    tracking = fields.Boolean(
+        'Tracking', help='Count the impressions of the banner and route its '
+        'clicks through the click counting url.'
+    )
+    impressions = fields.Function(
+        fields.Integer('Impressions'), 'get_tracking_counts'
+    )
+    clicks = fields.Function(fields.Integer('Clicks'), 'get_tracking_counts')
+
+    _tracking_counter = BufferedCounter('nereid.cms.banner.stat')
+
+    #: Fields from which the samplers of the categories are built
+    _sampler_fields = ['weight', 'state', 'category']
+
+    #: Fields whose change refreshes the cached copy of the remote image
+    _image_caching_fields = [
+        'state', 'type', 'remote_image_url', 'cache_remote_image',
+    ]
 
     @classmethod
     def __setup__(cls):
@@ -402,23 +917,103 @@ class Banner(Workflow, ModelSQL, ModelView):
     def publish(cls, banners):
         pass
 
+    @classmethod
+    def create(cls, vlist):
+        BannerCategory = Pool().get('nereid.cms.banner.category')
+
+        banners = super(Banner, cls).create(vlist)
+        cls.queue_purge(banners)
+        BannerCategory._sampler_cache.clear()
+        cls.schedule_image_caching(banners)
+        return banners
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        BannerCategory = pool.get('nereid.cms.banner.category')
+        StaticFile = pool.get('nereid.static.file')
+
+        # The copy and the validators of the previous remote image must not
+        # be served or sent for the new one
+        actions = iter(args)
+        args, stale_images = [], []
+        for records, values in zip(actions, actions):
+            moved = [
+                banner for banner in records
+                if 'remote_image_url' in values and
+                banner.remote_image_url != values['remote_image_url']
+            ]
+            kept = [banner for banner in records if banner not in moved]
+            if kept:
+                args.extend([kept, values])
+            if moved:
+                stale_images.extend(
+                    banner.cached_image for banner in moved
+                    if banner.cached_image
+                )
+                args.extend([moved, dict(
+                    values, cached_image=None, cached_image_etag=None,
+                    cached_image_modified=None
+                )])
+
+        cls._purge_written(args)
+        super(Banner, cls).write(*args)
+        cls._purge_written(args)
+        actions = iter(args)
+        if any(
+                set(values) & set(cls._sampler_fields)
+                for _, values in zip(actions, actions)):
+            BannerCategory._sampler_cache.clear()
+        if stale_images:
+            StaticFile.delete(list(set(stale_images)))
+
+        actions = iter(args)
+        cls.schedule_image_caching(list(chain.from_iterable(
+            records for records, values in zip(actions, actions)
+            if set(values) & set(cls._image_caching_fields)
+        )))
+
+    @classmethod
+    def delete(cls, banners):
+        BannerCategory = Pool().get('nereid.cms.banner.category')
+
+        cls.queue_purge(banners)
+        super(Banner, cls).delete(banners)
+        BannerCategory._sampler_cache.clear()
+
+    def get_surrogate_keys(self):
+        return [self.surrogate_key, self.category.surrogate_key]
+
     def get_html(self):
         """Return the HTML content"""
         StaticFile = Pool().get('nereid.static.file')
 
+        note_surrogate_keys([self.surrogate_key])
+
         banner = self.read(
             [self], [
                 'type', 'click_url', 'file',
                 'remote_image_url', 'custom_code', 'height', 'width',
-                'alternative_text', 'click_url'
+                'alternative_text', 'click_url', 'tracking',
+                'cache_remote_image', 'cached_image',
             ]
         )[0]
 
+        if banner['tracking']:
+            self._tracking_counter.incr(
+                (self.id, datetime.utcnow().date(), 'impressions')
+            )
+            if banner['click_url']:
+                banner['click_url'] = url_for(
+                    'nereid.cms.banner.click', active_id=self.id
+                )
+
         if banner['type'] == 'image':
             # replace the `file` in the dictionary with the complete url
             # that is required to render the image based on static file
             file = StaticFile(banner['file'])
             banner['file'] = file.url
+            note_preload(banner['file'])
             image = Template(
                 u'<a href="$click_url">'
                 u'<img src="$file" alt="$alternative_text"'
@@ -427,6 +1022,11 @@ class Banner(Workflow, ModelSQL, ModelView):
             )
             return image.substitute(**banner)
         elif banner['type'] == 'remote_image':
+            if banner['cache_remote_image'] and banner['cached_image']:
+                banner['remote_image_url'] = StaticFile(
+                    banner['cached_image']
+                ).url
+            note_preload(banner['remote_image_url'])
             image = Template(
                 u'<a href="$click_url">'
                 u'<img src="$remote_image_url" alt="$alternative_text"'
@@ -436,6 +1036,150 @@ class Banner(Workflow, ModelSQL, ModelView):
         elif banner['type'] == 'custom_code':
             return banner['custom_code']
 
+    @route('/banner/<int:active_id>/click')
+    def click(self):
+        """
+        Count a click on the published tracked banner and redirect to its
+        click url
+        """
+        if not self.search([
+                ('id', '=', self.id),
+                ('state', '=', 'published'),
+                ('tracking', '=', True),
+                ('click_url', '!=', None),
+        ]):
+            abort(404)
+        self._tracking_counter.incr(
+            (self.id, datetime.utcnow().date(), 'clicks')
+        )
+        return redirect(self.click_url)
+
+    @classmethod
+    def get_tracking_counts(cls, banners, names):
+        """
+        Return the impressions and clicks of the banners, including the ones
+        this worker did not flush yet
+        """
+        BannerStat = Pool().get('nereid.cms.banner.stat')
+        cursor = Transaction().cursor
+        table = BannerStat.__table__()
+
+        ids = map(int, banners)
+        result = dict((name, dict.fromkeys(ids, 0)) for name in names)
+        for sub_ids in _chunks(ids, cursor.IN_MAX):
+            cursor.execute(*table.select(
+                table.banner, Sum(table.impressions), Sum(table.clicks),
+                where=table.banner.in_(sub_ids), group_by=[table.banner]
+            ))
+            for banner, impressions, clicks in cursor.fetchall():
+                counts = {'impressions': impressions, 'clicks': clicks}
+                for name in names:
+                    result[name][banner] = counts[name] or 0
+        for (banner, _, name), count in (
+                cls._tracking_counter.pending().iteritems()):
+            if name in names and banner in result[name]:
+                result[name][banner] += count
+        return result
+
+    def get_image_url(self):
+        """
+        Return the url of the image of the banner, if it is an image
+        """
+        if self.type == 'image' and self.file:
+            return self.file.url
+        elif self.type == 'remote_image':
+            if self.cache_remote_image and self.cached_image:
+                return self.cached_image.url
+            return self.remote_image_url
+
+    @classmethod
+    def schedule_image_caching(cls, banners):
+        """
+        Queue the background download of the remote image of the published
+        banners which cache it
+        """
+        Job = Pool().get('nereid.cms.artifact.job')
+
+        Job.enqueue([{
+            'key': 'banner-image:%d' % banner.id,
+            'model': cls.__name__,
+            'method': 'cache_image',
+            'record': banner.id,
+        } for banner in banners if banner.state == 'published'
+            and banner.type == 'remote_image' and banner.cache_remote_image])
+
+    @classmethod
+    def refresh_cached_images(cls):
+        """
+        Queue the refresh of every cached remote image. Run by the cron; the
+        images are only downloaded again if they changed.
+        """
+        cls.schedule_image_caching(cls.search([
+            ('state', '=', 'published'),
+            ('type', '=', 'remote_image'),
+            ('cache_remote_image', '=', True),
+        ]))
+
+    @classmethod
+    def cache_image(cls, banner_id):
+        """
+        Store a copy of the remote image of the banner in the CMS static
+        folder of its website. The request is conditional (ETag and
+        Last-Modified of the copy) so an unchanged image is not downloaded
+        again. Run by the artifact jobs.
+        """
+        StaticFile = Pool().get('nereid.static.file')
+
+        banner = cls(banner_id)
+        website = banner.category.website
+        if not (website and website.cms_static_folder):
+            return
+
+        headers = {}
+        if banner.cached_image:
+            if banner.cached_image_etag:
+                headers['If-None-Match'] = banner.cached_image_etag
+            if banner.cached_image_modified:
+                headers['If-Modified-Since'] = banner.cached_image_modified
+        try:
+            response = urllib2.urlopen(
+                urllib2.Request(banner.remote_image_url, headers=headers),
+                timeout=30
+            )
+            content = response.read()
+        except urllib2.HTTPError as exc:
+            if exc.code != 304:
+                logger.warning(
+                    'Caching of %s failed: %s', banner.remote_image_url, exc
+                )
+            return
+        except urllib2.URLError as exc:
+            logger.warning(
+                'Caching of %s failed: %s', banner.remote_image_url, exc
+            )
+            return
+
+        if banner.cached_image:
+            cached_image = banner.cached_image
+            StaticFile.write([cached_image], {'file_binary': content})
+        else:
+            extension = (
+                os.path.splitext(urlparse(banner.remote_image_url).path)[1] or
+                mimetypes.guess_extension(response.info().gettype()) or ''
+            )
+            cached_image, = StaticFile.create([{
+                'folder': website.cms_static_folder.id,
+                'name': 'banner-%d%s' % (banner.id, extension),
+                'file_binary': content,
+            }])
+        cls.write([banner], {
+            'cached_image': cached_image.id,
+            'cached_image_etag': response.info().getheader('ETag'),
+            'cached_image_modified': response.info().getheader(
+                'Last-Modified'
+            ),
+        })
+
     @classmethod
     def allowed_models(cls):
         MenuItem = Pool().get('nereid.cms.menuitem')
@@ -446,6 +1190,18 @@ class Banner(Workflow, ModelSQL, ModelView):
     def default_type():
         return 'image'
 
+    @staticmethod
+    def default_tracking():
+        return False
+
+    @staticmethod
+    def default_weight():
+        return 1
+
+    @staticmethod
+    def default_cache_remote_image():
+        return False
+
     @staticmethod
     def default_state():
         if 'published' in Transaction().context:
@@ -453,7 +1209,9 @@ class Banner(Workflow, ModelSQL, ModelView):
         return 'draft'
 
 
-class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
+class ArticleCategory(
+        ModelSQL, ModelView, CMSMenuItemMixin, TranslationPrefetchMixin,
+        SurrogateKeyMixin):
     "Article Categories"
     __name__ = 'nereid.cms.article.category'
     _rec_name = 'title'
@@ -520,8 +1278,33 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
         return 10
 
     @classmethod
-    @route('/article-category/<uri>/')
-    @route('/article-category/<uri>/<int:page>')
+    def create(cls, vlist):
+        categories = super(ArticleCategory, cls).create(vlist)
+        cls.queue_purge(categories)
+        return categories
+
+    @classmethod
+    def write(cls, *args):
+        ArticleNeighbor = Pool().get('nereid.cms.article.neighbor')
+
+        super(ArticleCategory, cls).write(*args)
+        cls._purge_written(args)
+
+        actions = iter(args)
+        ArticleNeighbor.refresh(chain.from_iterable(
+            records for records, values in zip(actions, actions)
+            if 'sort_order' in values
+        ))
+
+    @classmethod
+    def delete(cls, categories):
+        cls.queue_purge(categories)
+        super(ArticleCategory, cls).delete(categories)
+
+    @classmethod
+    @route('/article-category/<uri>/', readonly=True)
+    @route('/article-category/<uri>/<int:page>', readonly=True)
+    @read_replica
     def render(cls, uri, page=1):
         """
         Renders the category
@@ -534,22 +1317,37 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
         except ValueError:
             abort(404)
 
-        order = []
-        if category.sort_order == 'recent_first':
-            order.append(('write_date', 'DESC'))
-        elif category.sort_order == 'older_first':
-            order.append(('write_date', 'ASC'))
-        elif category.sort_order == 'sequence':
-            order.append(('sequence', 'ASC'))
-
-        articles = Pagination(
+        articles = CMSPagination(
             Article, [
                 ('categories', '=', category.id),
                 ('state', '=', 'published')
-            ], page, category.articles_per_page, order=order
+            ], page, category.articles_per_page,
+            order=category.get_article_order()
         )
-        return render_template(
-            category.template, category=category, articles=articles)
+        Article.prefetch_translations(articles.items())
+        if category.banner:
+            note_preload(category.banner.get_image_url())
+        for article in articles.items():
+            note_preload(article.image and article.image.url)
+        return add_preload_links(surrogate_response(
+            unicode(render_template(
+                category.template, category=category, articles=articles
+            )),
+            [category.surrogate_key] +
+            [article.surrogate_key for article in articles.items()]
+        ))
+
+    def get_article_order(self):
+        """
+        Return the order of the articles listed in the category
+        """
+        if self.sort_order == 'recent_first':
+            return [('write_date', 'DESC'), ('id', 'DESC')]
+        elif self.sort_order == 'older_first':
+            return [('write_date', 'ASC'), ('id', 'ASC')]
+        elif self.sort_order == 'sequence':
+            return [('sequence', 'ASC'), ('id', 'ASC')]
+        return []
 
     @classmethod
     @context_processor('get_article_category')
@@ -562,15 +1360,17 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
         return category[0] if category else None
 
     @classmethod
-    @route('/sitemaps/article-category-index.xml')
+    @route('/sitemaps/article-category-index.xml', readonly=True)
+    @read_replica
     def sitemap_index(cls):
         index = SitemapIndex(cls, [])
         return index.render()
 
     @classmethod
-    @route('/sitemaps/article-category-<int:page>.xml')
+    @route('/sitemaps/article-category-<int:page>.xml', readonly=True)
+    @read_replica
     def sitemap(cls, page):
-        sitemap_section = SitemapSection(cls, [], page)
+        sitemap_section = CMSSitemapSection(cls, [], page)
         sitemap_section.changefreq = 'daily'
         return sitemap_section.render()
 
@@ -602,6 +1402,7 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
             ('state', '=', 'published'),
             ('categories', '=', self.id)
         ])
+        NereidArticle.prefetch_translations(articles)
         return [
             article.get_menu_item(max_depth=max_depth - 1)
             for article in articles
@@ -619,7 +1420,8 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
             return super(ArticleCategory, self).serialize(purpose=purpose)
 
     @classmethod
-    @route('/article-category/<uri>.atom')
+    @route('/article-category/<uri>.atom', readonly=True)
+    @read_replica
     def atom_feed(cls, uri):
         """
         Returns atom feed for articles published under a particular category.
@@ -631,17 +1433,66 @@ class ArticleCategory(ModelSQL, ModelView, CMSMenuItemMixin):
         except ValueError:
             abort(404)
 
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        content = Artifact.get_or_queue(
+            category._feed_artifact_key(), category._feed_job()
+        )
+        return surrogate_response(
+            content, [category.surrogate_key],
+            mimetype='application/atom+xml'
+        )
+
+    def _feed_artifact_key(self):
+        return _request_artifact_key('article-category-feed', self.id)
+
+    def _feed_job(self):
+        return {
+            'key': 'article-category-feed:%d' % self.id,
+            'model': self.__name__,
+            'method': 'generate_atom_feed',
+            'record': self.id,
+            'needs_request': True,
+        }
+
+    def build_atom_feed(self):
+        """
+        Return the atom feed of the articles published under the category
+        """
+        Article = Pool().get('nereid.cms.article')
+
         feed = AtomFeed(
-            "Articles by Category %s" % category.unique_name,
-            feed_url=request.url, url=request.host_url
+            "Articles by Category %s" % self.unique_name,
+            feed_url=url_for(
+                'nereid.cms.article.category.atom_feed',
+                uri=self.unique_name, _external=True
+            ),
+            url=request.host_url
         )
-        for article in category.published_articles:
+        Article.prefetch_translations(self.published_articles)
+        for article in self.published_articles:
             feed.add(**article.serialize(purpose='atom'))
+        return feed.to_string()
 
-        return feed.get_response()
+    @classmethod
+    def generate_atom_feed(cls, category_id):
+        """
+        Store the atom feed of the category as an artifact. Run by the
+        artifact jobs.
+        """
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        category = cls(category_id)
+        Artifact.generate(
+            category._feed_artifact_key(), category.build_atom_feed,
+            resource=str(category)
+        )
 
 
-class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
+class Article(
+        Workflow, ModelSQL, ModelView, CMSMenuItemMixin,
+        ScheduledTransitionMixin, TranslationPrefetchMixin,
+        SurrogateKeyMixin):
     "CMS Articles"
     __name__ = 'nereid.cms.article'
     _rec_name = 'uri'
@@ -691,17 +1542,68 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
 
         super(Article, cls).__register__(module_name)
 
-    @classmethod
-    def __setup__(cls):
-        super(Article, cls).__setup__()
-        cls._order.insert(0, ('sequence', 'ASC'))
-        cls._transitions |= set((
-                ('draft', 'published'),
-                ('published', 'draft'),
-                ('published', 'archived'),
-                ('archived', 'draft'),
-        ))
-        cls._buttons.update({
+        # Archive listings filter on both, author pages on the author too
+        table = TableHandler(cursor, cls, module_name)
+        table.index_action(['state', 'published_on'], 'add')
+        table.index_action(['author', 'state', 'published_on'], 'add')
+
+    #: Fields exchanged as is by the bulk import and export of articles
+    _bulk_fields = [
+        'uri', 'title', 'content', 'content_type', 'template', 'description',
+        'sequence', 'state', 'published_on',
+    ]
+
+    #: Number of related articles precomputed for each article
+    _related_limit = 20
+
+    #: Fields from which the html of the article is rendered
+    _html_fields = ['content', 'content_type']
+
+    #: Fields indexed by the URI lookup table
+    _uri_fields = ['uri', 'state']
+
+    #: Fields counted by the archive table
+    _archive_fields = ['published_on', 'state', 'categories']
+
+    #: Fields which move an article in the listings of its categories
+    _neighbor_fields = ['state', 'sequence', 'categories']
+
+    #: Fields counted by the published article count of the authors
+    _author_fields = ['author', 'state', 'published_on']
+
+    #: Fields from which the html, feeds and sitemaps listing the article
+    #: are rendered
+    _rendered_fields = [
+        'uri', 'title', 'content', 'content_type', 'state', 'published_on',
+        'author', 'categories',
+    ]
+
+    _uri_cache = Cache('nereid.cms.article.uri', context=False)
+
+    _view_counter = BufferedCounter('nereid.cms.article.view')
+
+    @classmethod
+    def __setup__(cls):
+        super(Article, cls).__setup__()
+        cls._error_messages.update({
+            'unknown_category':
+            'Article category "%s" referenced by article "%s" does not exist.',
+            'unknown_author':
+            'Author "%s" referenced by article "%s" does not exist.',
+            'duplicate_uri':
+            'The URI "%s" of article "%s" is already used by a published '
+            'article in %s.',
+            'renderer_unavailable':
+            '`%s` not installed, to render %s articles.',
+        })
+        cls._order.insert(0, ('sequence', 'ASC'))
+        cls._transitions |= set((
+                ('draft', 'published'),
+                ('published', 'draft'),
+                ('published', 'archived'),
+                ('archived', 'draft'),
+        ))
+        cls._buttons.update({
             'archive': {
                 'invisible': Eval('state') != 'published',
             },
@@ -716,20 +1618,14 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
     @classmethod
     def content_type_selection(cls):
         """
-        Returns a selection for content_type.
+        Returns a selection for content_type: the formats of the renderer
+        registry whose library is installed.
         """
-        default_types = [
-            ('html', 'HTML'),
-            ('plain', 'Plain Text')
+        return [
+            (renderer.name, renderer.label)
+            for renderer in available_renderers()
         ]
 
-        if markdown:
-            default_types.append(('markdown', 'Markdown'))
-        if publish_parts:
-            default_types.append(('rst', 'reStructured TeXT'))
-
-        return default_types
-
     @classmethod
     def default_content_type(cls):
         """
@@ -739,41 +1635,550 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
 
     def __html__(self):
         """
-        Uses content_type field to generate html content.
+        Return the html content of the article.
         Concept from Jinja2's Markup class.
+
+        The html of published articles is generated in the background by the
+        artifact jobs and only rendered inline until it is available.
         """
-        if self.content_type == 'rst':
-            if publish_parts:
-                res = publish_parts(self.content, writer_name='html')
-                return res['html_body']
-            self.raise_user_error(
-                "`docutils` not installed, to render rst articles."
-            )
-        if self.content_type == 'markdown':
-            if markdown:
-                return markdown(self.content)
-            self.raise_user_error(
-                "`markdown` not installed, to render markdown article."
-            )
-        return self.content
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        if self.id >= 0 and self.state == 'published':
+            html = Artifact.get_content(self._html_artifact_key())
+            if html is not None:
+                return html
+        return self.render_content()
+
+    def _html_artifact_key(self):
+        return u'article-html:%d:%s' % (self.id, Transaction().language)
+
+    def render_content(self):
+        """
+        Uses content_type field to generate html content with the renderer
+        registered for it.
+        """
+        renderer = get_renderer(self.content_type)
+        if renderer is None:
+            return self.content
+        if not renderer.is_available():
+            self.raise_user_error('renderer_unavailable', (
+                renderer.requires, self.content_type
+            ))
+        return renderer.render(self.content)
 
     @classmethod
     @ModelView.button
     @Workflow.transition('archived')
     def archive(cls, articles):
-        pass
+        cls.clear_related(articles)
 
     @classmethod
     @ModelView.button
     @Workflow.transition('published')
     def publish(cls, articles):
-        pass
+        cls.refresh_related(articles)
 
     @classmethod
     @ModelView.button
     @Workflow.transition('draft')
     def draft(cls, articles):
-        pass
+        cls.clear_related(articles)
+
+    @classmethod
+    def create(cls, vlist):
+        pool = Pool()
+        ArticleArchive = pool.get('nereid.cms.article.archive')
+        ArticleNeighbor = pool.get('nereid.cms.article.neighbor')
+        NereidUser = pool.get('nereid.user')
+
+        articles = super(Article, cls).create(vlist)
+        published = [a for a in articles if a.state == 'published']
+        cls.refresh_related(published)
+        cls.refresh_uri_index(published)
+        cls.schedule_artifacts(published)
+        cls.queue_purge(published)
+        ArticleArchive.refresh(cls._archive_months(published))
+        ArticleNeighbor.refresh(cls._neighbor_categories(published))
+        NereidUser.refresh_article_counts(cls._authors(published))
+        return articles
+
+    @classmethod
+    def write(cls, *args):
+        pool = Pool()
+        Artifact = pool.get('nereid.cms.artifact')
+        ArticleArchive = pool.get('nereid.cms.article.archive')
+        ArticleNeighbor = pool.get('nereid.cms.article.neighbor')
+        NereidUser = pool.get('nereid.user')
+
+        actions = iter(args)
+        counted = list(chain.from_iterable(
+            records for records, values in zip(actions, actions)
+            if set(values) & set(cls._archive_fields)
+        ))
+        # The months the articles leave are counted again too
+        months = cls._archive_months(counted)
+
+        actions = iter(args)
+        recounted = list(chain.from_iterable(
+            records for records, values in zip(actions, actions)
+            if set(values) & set(cls._author_fields)
+        ))
+        # As are the authors the articles are taken from
+        authors = cls._authors(recounted)
+
+        actions = iter(args)
+        written = [
+            (map(int, records), bool(set(values) & set(cls._neighbor_fields)))
+            for records, values in zip(actions, actions)
+        ]
+        # So are the listings the articles leave
+        categories = set(chain.from_iterable(
+            cls._neighbor_categories(cls.browse(ids))
+            for ids, moved in written if moved
+        ))
+
+        actions = iter(args)
+        rendered = list(chain.from_iterable(
+            records for records, values in zip(actions, actions)
+            if set(values) & set(cls._rendered_fields)
+        ))
+        # The feeds of the categories and the author the published articles
+        # leave are generated again too
+        cls.schedule_artifacts([a for a in rendered if a.state == 'published'])
+
+        # The categories the articles are removed from are purged too
+        cls._purge_written(args)
+        super(Article, cls).write(*args)
+        cls._purge_written(args)
+
+        actions = iter(args)
+        changed, moved, recategorised = [], [], []
+        for records, values in zip(actions, actions):
+            if set(values) & set(cls._html_fields):
+                changed.extend(records)
+            if set(values) & set(cls._uri_fields):
+                moved.extend(records)
+            if 'categories' in values:
+                recategorised.extend(records)
+        Artifact.invalidate([str(article) for article in changed])
+        cls.refresh_uri_index(moved)
+        cls.refresh_related([
+            a for a in cls.browse(map(int, recategorised))
+            if a.state == 'published'
+        ])
+        cls.schedule_artifacts([
+            a for a in cls.browse(map(int, rendered)) if a.state == 'published'
+        ])
+        ArticleArchive.refresh(
+            months | cls._archive_months(cls.browse(map(int, counted)))
+        )
+        categories |= set(chain.from_iterable(
+            cls._neighbor_categories(cls.browse(ids))
+            for ids, moved in written if moved
+        ))
+        # The other articles only change their write date
+        touched = set(chain.from_iterable(
+            ids for ids, moved in written if not moved
+        ))
+        ArticleNeighbor.refresh(categories | ArticleNeighbor.touch(
+            cls.browse(list(touched)), categories
+        ))
+        NereidUser.refresh_article_counts(
+            authors | cls._authors(cls.browse(map(int, recounted)))
+        )
+
+    @classmethod
+    def delete(cls, articles):
+        pool = Pool()
+        ArticleArchive = pool.get('nereid.cms.article.archive')
+        ArticleNeighbor = pool.get('nereid.cms.article.neighbor')
+        NereidUser = pool.get('nereid.user')
+
+        months = cls._archive_months(articles)
+        categories = cls._neighbor_categories(articles)
+        authors = cls._authors(articles)
+        cls.queue_purge(articles)
+        super(Article, cls).delete(articles)
+        cls._uri_cache.clear()
+        ArticleArchive.refresh(months)
+        ArticleNeighbor.refresh(categories)
+        NereidUser.refresh_article_counts(authors)
+
+    @staticmethod
+    def _archive_months(articles):
+        """
+        Return the (year, month) in which the articles are published
+        """
+        return set(
+            (a.published_on.year, a.published_on.month)
+            for a in articles if a.published_on
+        )
+
+    @staticmethod
+    def _authors(articles):
+        """
+        Return the ids of the authors of the articles
+        """
+        return set(a.author.id for a in articles if a.author)
+
+    @staticmethod
+    def _neighbor_categories(articles):
+        """
+        Return the ids of the categories listing the articles
+        """
+        return set(
+            category.id for article in articles
+            for category in article.categories
+        )
+
+    def get_neighbors(self, category):
+        """
+        Return the previous and the next published article in the listing
+        order of the category, None at either end or if the article is not
+        listed in the category::
+
+            {% set previous, next = article.get_neighbors(category) %}
+        """
+        ArticleNeighbor = Pool().get('nereid.cms.article.neighbor')
+
+        neighbors = ArticleNeighbor.search([
+            ('article', '=', self.id),
+            ('category', '=', int(category)),
+        ], limit=1)
+        if not neighbors:
+            return None, None
+        return neighbors[0].previous, neighbors[0].next
+
+    def get_surrogate_keys(self):
+        return [self.surrogate_key, self.list_surrogate_key()] + [
+            category.surrogate_key for category in self.categories
+        ]
+
+    @classmethod
+    def refresh_uri_index(cls, articles):
+        """
+        Rewrite the rows of the URI lookup table of the given articles (or
+        ids): one row per translatable language for each published article.
+        A URI used by two published articles in a language is refused.
+
+        The hot URI cache is cleared once for the whole batch.
+        """
+        pool = Pool()
+        ArticleURI = pool.get('nereid.cms.article.uri')
+        Language = pool.get('ir.lang')
+        cursor = Transaction().cursor
+        table = ArticleURI.__table__()
+
+        ids = list(set(map(int, articles)))
+        if not ids:
+            return
+        for sub_ids in _chunks(ids, cursor.IN_MAX):
+            cursor.execute(*table.delete(where=table.article.in_(sub_ids)))
+
+        published = map(int, cls.search([
+            ('id', 'in', ids),
+            ('state', '=', 'published'),
+        ]))
+        values = []
+        for language in Language.search([('translatable', '=', True)]):
+            with Transaction().set_context(language=language.code):
+                values.extend(
+                    [record['id'], language.code, record['uri'],
+                        Transaction().user, CurrentTimestamp()]
+                    for record in cls.read(published, ['uri'])
+                )
+        cls._check_uri_unique(values)
+        for sub_values in _chunks(values, 1000):
+            cursor.execute(*table.insert(
+                columns=[
+                    table.article, table.language, table.uri,
+                    table.create_uid, table.create_date,
+                ],
+                values=sub_values
+            ))
+        cls._uri_cache.clear()
+
+    @classmethod
+    def _check_uri_unique(cls, values):
+        """
+        Raise an error if the (article, language, uri) rows to index use a URI
+        twice in a language, or a URI indexed for another article
+        """
+        ArticleURI = Pool().get('nereid.cms.article.uri')
+        cursor = Transaction().cursor
+        table = ArticleURI.__table__()
+
+        owners = {}
+        for row in values:
+            article_id, language, uri = row[:3]
+            if owners.setdefault((language, uri), article_id) != article_id:
+                cls.raise_user_error(
+                    'duplicate_uri', (uri, cls(article_id).rec_name, language)
+                )
+        by_language = {}
+        for language, uri in owners:
+            by_language.setdefault(language, []).append(uri)
+        for language, uris in by_language.iteritems():
+            for sub_uris in _chunks(uris, cursor.IN_MAX):
+                cursor.execute(*table.select(
+                    table.uri, where=(table.language == language) &
+                    table.uri.in_(sub_uris), limit=1
+                ))
+                used = cursor.fetchone()
+                if used:
+                    cls.raise_user_error('duplicate_uri', (
+                        used[0], cls(owners[(language, used[0])]).rec_name,
+                        language,
+                    ))
+
+    @classmethod
+    def get_id_from_uri(cls, uri):
+        """
+        Return the id of the published article with the given uri in the
+        language of the transaction, or None.
+
+        Hot uris are answered from an in-memory LRU cache, the others with a
+        single lookup on the unique (language, uri) index. Unknown uris are
+        not cached. Articles published
+        before the index existed are found by a search on the translated uri.
+        """
+        ArticleURI = Pool().get('nereid.cms.article.uri')
+
+        key = (Transaction().language, uri)
+        article_id = cls._uri_cache.get(key)
+        if article_id is not None:
+            return article_id
+
+        rows = ArticleURI.search([
+            ('language', '=', key[0]),
+            ('uri', '=', uri),
+        ], limit=1)
+        if rows:
+            article_id = rows[0].article.id
+        else:
+            # The oldest one if articles published before the URIs were
+            # checked share the uri
+            articles = cls.search([
+                ('uri', '=', uri),
+                ('state', '=', 'published'),
+            ], order=[('id', 'ASC')], limit=1)
+            if not articles:
+                # Not cached: the article may be published meanwhile, or
+                # not be on the replica yet
+                return None
+            article_id = articles[0].id
+        return cls._uri_cache.set(key, article_id)
+
+    @classmethod
+    def schedule_artifacts(cls, articles):
+        """
+        Queue the background regeneration of the html of the articles and of
+        the feeds and sitemap sections listing them
+        """
+        Job = Pool().get('nereid.cms.artifact.job')
+
+        if not articles:
+            return
+        jobs = [cls._feed_job()]
+        for article in articles:
+            page = (article.id - 1) // SitemapSection.batch_size + 1
+            jobs.extend([{
+                'key': 'article-html:%d' % article.id,
+                'model': cls.__name__,
+                'method': 'generate_html',
+                'record': article.id,
+            }, cls._sitemap_job(page)])
+            jobs.extend(
+                category._feed_job() for category in article.categories
+            )
+            if article.author:
+                jobs.append(article.author._feed_job())
+        Job.enqueue(jobs)
+
+    @classmethod
+    def generate_html(cls, article_id):
+        """
+        Store the html of a published article in every translatable language
+        as artifacts. Run by the artifact jobs.
+        """
+        pool = Pool()
+        Artifact = pool.get('nereid.cms.artifact')
+        Language = pool.get('ir.lang')
+
+        if cls(article_id).state != 'published':
+            return
+        for language in Language.search([('translatable', '=', True)]):
+            with Transaction().set_context(language=language.code):
+                article = cls(article_id)
+                Artifact.store(
+                    article._html_artifact_key(), article.render_content(),
+                    resource=str(article)
+                )
+
+    @classmethod
+    def clear_related(cls, articles):
+        """
+        Remove the given articles from the related articles table, both as
+        articles and as related articles
+        """
+        Related = Pool().get('nereid.cms.article.related')
+        cursor = Transaction().cursor
+        related = Related.__table__()
+
+        for sub_ids in _chunks(map(int, articles), cursor.IN_MAX):
+            cursor.execute(*related.delete(
+                where=related.article.in_(sub_ids) |
+                related.related.in_(sub_ids)
+            ))
+
+    @classmethod
+    def refresh_related(cls, articles):
+        """
+        Recompute the related articles of the given (being) published
+        articles.
+
+        Candidates are the published articles sharing at least one category
+        and are scored by the number of shared categories. When the
+        `related_text_weight` option of the `nereid_cms` configuration
+        section is set, the cosine similarity of the term frequencies of the
+        title, description and content, multiplied by that weight, is added
+        to the score.
+
+        The best `_related_limit` candidates are stored for each article and
+        the article is added to the related articles of those candidates, so
+        only the rows touching the given articles are rewritten.
+        """
+        Related = Pool().get('nereid.cms.article.related')
+        cursor = Transaction().cursor
+        related = Related.__table__()
+
+        cls.clear_related(articles)
+
+        scores = cls._related_scores(map(int, articles))
+        text_weight = config.getfloat(
+            'nereid_cms', 'related_text_weight', default=0
+        )
+        if text_weight and scores:
+            cls._add_text_scores(scores, text_weight)
+
+        rows = {}
+        for article_id, candidates in scores.iteritems():
+            best = sorted(
+                candidates.iteritems(), key=lambda c: c[1], reverse=True
+            )[:cls._related_limit]
+            for related_id, score in best:
+                rows[(article_id, related_id)] = score
+                rows.setdefault((related_id, article_id), score)
+
+        values = [
+            [article_id, related_id, score, Transaction().user,
+                CurrentTimestamp()]
+            for (article_id, related_id), score in rows.iteritems()
+        ]
+        for sub_values in _chunks(values, 1000):
+            cursor.execute(*related.insert(
+                columns=[
+                    related.article, related.related, related.score,
+                    related.create_uid, related.create_date,
+                ],
+                values=sub_values
+            ))
+        # The candidates got the articles added to their related articles
+        cls._trim_related(set(article_id for article_id, _ in rows))
+
+    @classmethod
+    def _related_scores(cls, ids):
+        """
+        Return the published candidates of the articles, by article id, with
+        the number of categories they share as score
+        """
+        CategoryArticle = Pool().get('nereid.cms.category-article')
+        cursor = Transaction().cursor
+        rel_a = CategoryArticle.__table__()
+        rel_b = CategoryArticle.__table__()
+        article = cls.__table__()
+
+        scores = {}
+        for sub_ids in _chunks(ids, cursor.IN_MAX):
+            cursor.execute(*rel_a.join(
+                rel_b, condition=rel_a.category == rel_b.category
+            ).join(
+                article, condition=rel_b.article == article.id
+            ).select(
+                rel_a.article, rel_b.article, Count(rel_b.category),
+                where=rel_a.article.in_(sub_ids) &
+                (rel_b.article != rel_a.article) &
+                ((article.state == 'published') | article.id.in_(ids)),
+                group_by=[rel_a.article, rel_b.article]
+            ))
+            for article_id, related_id, shared in cursor.fetchall():
+                scores.setdefault(article_id, {})[related_id] = float(shared)
+        return scores
+
+    @classmethod
+    def _add_text_scores(cls, scores, weight):
+        """
+        Add to the scores the text similarity of the candidates, multiplied
+        by the weight
+        """
+        cursor = Transaction().cursor
+
+        vectors = {}
+        candidate_ids = set(scores)
+        for candidates in scores.itervalues():
+            candidate_ids.update(candidates)
+        for sub_ids in _chunks(list(candidate_ids), cursor.IN_MAX):
+            for record in cls.read(
+                    sub_ids, ['title', 'description', 'content']):
+                vectors[record['id']] = _term_vector(u' '.join([
+                    record['title'] or u'', record['description'] or u'',
+                    record['content'] or u'',
+                ]))
+        for article_id, candidates in scores.iteritems():
+            for related_id in candidates:
+                candidates[related_id] += weight * _cosine_similarity(
+                    vectors[article_id], vectors[related_id]
+                )
+
+    @classmethod
+    def _trim_related(cls, article_ids):
+        """
+        Delete the related articles of the given articles beyond the best
+        `_related_limit`, in the order of `get_related`
+        """
+        Related = Pool().get('nereid.cms.article.related')
+        cursor = Transaction().cursor
+        related = Related.__table__()
+
+        extra = []
+        for sub_ids in _chunks(list(article_ids), cursor.IN_MAX):
+            cursor.execute(*related.select(
+                related.id, related.article,
+                where=related.article.in_(sub_ids),
+                order_by=[
+                    related.article, related.score.desc, related.id.asc,
+                ]
+            ))
+            kept = {}
+            for row_id, article_id in cursor.fetchall():
+                kept[article_id] = kept.get(article_id, 0) + 1
+                if kept[article_id] > cls._related_limit:
+                    extra.append(row_id)
+        for sub_ids in _chunks(extra, cursor.IN_MAX):
+            cursor.execute(*related.delete(where=related.id.in_(sub_ids)))
+
+    def get_related(self, limit=5):
+        """
+        Return the published articles related to this article, the most
+        related first, from the precomputed related articles table
+        """
+        Related = Pool().get('nereid.cms.article.related')
+
+        return [
+            row.related for row in Related.search([
+                ('article', '=', self.id),
+            ], order=[('score', 'DESC'), ('id', 'ASC')], limit=limit)
+        ]
 
     @classmethod
     def allowed_models(cls):
@@ -821,32 +2226,345 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
         return Date.today()
 
     @classmethod
-    @route('/article/<uri>')
+    def _bulk_value(cls, name, value):
+        """
+        Convert a value read from an import file to the python value of the
+        field
+        """
+        if value in ('', None):
+            return None
+        field_type = cls._fields[name]._type
+        if field_type == 'integer':
+            return int(value)
+        if field_type == 'date' and isinstance(value, basestring):
+            return datetime.strptime(value, '%Y-%m-%d').date()
+        return value
+
+    @classmethod
+    def bulk_import(cls, rows, batch_size=1000):
+        """
+        Create articles from an iterable of dictionaries and return the number
+        of articles created.
+
+        Each row holds the fields listed in `_bulk_fields`, the unique names of
+        the article categories under `categories` and the email of the author
+        under `author`. Categories and authors are resolved from in-memory
+        maps and the default values are computed once per batch (so that
+        `default_employee` and friends are not called for every row). The
+        articles and the category relations of a batch are created with one
+        call each.
+        """
+        pool = Pool()
+        ArticleCategory = pool.get('nereid.cms.article.category')
+        CategoryArticle = pool.get('nereid.cms.category-article')
+        ArticleArchive = pool.get('nereid.cms.article.archive')
+        ArticleNeighbor = pool.get('nereid.cms.article.neighbor')
+        NereidUser = pool.get('nereid.user')
+
+        with Transaction().set_context(active_test=False):
+            categories = dict(
+                (category.unique_name, category.id)
+                for category in ArticleCategory.search([])
+            )
+        authors = {}
+        default_fields = [
+            name for name in cls._fields if hasattr(cls, 'default_' + name)
+        ]
+
+        count = 0
+        for batch in _chunks(rows, batch_size):
+            emails = set(
+                row['author'] for row in batch if row.get('author')
+            ) - set(authors)
+            if emails:
+                authors.update(
+                    (user.email, user.id) for user in NereidUser.search([
+                        ('email', 'in', list(emails)),
+                    ])
+                )
+
+            defaults = cls.default_get(default_fields, with_rec_name=False)
+            # Sequence is required but has no default
+            defaults.setdefault('sequence', 10)
+            vlist, batch_categories = [], []
+            for row in batch:
+                values = defaults.copy()
+                for name in cls._bulk_fields:
+                    if name in row:
+                        values[name] = cls._bulk_value(name, row[name])
+                if row.get('author'):
+                    if row['author'] not in authors:
+                        cls.raise_user_error(
+                            'unknown_author', (row['author'], row.get('uri'))
+                        )
+                    values['author'] = authors[row['author']]
+                category_ids = []
+                for unique_name in row.get('categories') or []:
+                    if unique_name not in categories:
+                        cls.raise_user_error(
+                            'unknown_category', (unique_name, row.get('uri'))
+                        )
+                    category_ids.append(categories[unique_name])
+                vlist.append(values)
+                batch_categories.append(category_ids)
+
+            articles = cls.create(vlist)
+            CategoryArticle.create([{
+                'article': article.id,
+                'category': category_id,
+            } for article, ids in zip(articles, batch_categories)
+                for category_id in ids])
+
+            # The tables maintained by `create` are refreshed again for the
+            # published articles now that their categories are set
+            published = cls.browse([
+                a.id for a, ids in zip(articles, batch_categories)
+                if a.state == 'published' and ids
+            ])
+            cls.refresh_related(published)
+            cls.queue_purge(published)
+            ArticleArchive.refresh(cls._archive_months(published))
+            ArticleNeighbor.refresh(cls._neighbor_categories(published))
+            count += len(articles)
+        return count
+
+    @classmethod
+    def bulk_export(cls, domain=None, batch_size=1000):
+        """
+        Yield the articles matching the domain as dictionaries in the format
+        accepted by `bulk_import`.
+
+        Articles are read a batch at a time in the order of their id, so the
+        export runs in constant memory however many articles there are.
+        """
+        pool = Pool()
+        ArticleCategory = pool.get('nereid.cms.article.category')
+        NereidUser = pool.get('nereid.user')
+
+        with Transaction().set_context(active_test=False):
+            categories = dict(
+                (category.id, category.unique_name)
+                for category in ArticleCategory.search([])
+            )
+
+        last_id = 0
+        while True:
+            articles = cls.search(
+                (domain or []) + [('id', '>', last_id)],
+                limit=batch_size, order=[('id', 'ASC')]
+            )
+            if not articles:
+                break
+            last_id = articles[-1].id
+
+            records = cls.read(
+                map(int, articles), cls._bulk_fields + ['author', 'categories']
+            )
+            authors = dict(
+                (user['id'], user['email']) for user in NereidUser.read(
+                    list(set(r['author'] for r in records if r['author'])),
+                    ['email']
+                )
+            )
+            for record in records:
+                row = dict((name, record[name]) for name in cls._bulk_fields)
+                if row['published_on']:
+                    row['published_on'] = row['published_on'].isoformat()
+                row['author'] = authors.get(record['author'])
+                row['categories'] = [
+                    categories[category_id]
+                    for category_id in record['categories']
+                ]
+                yield row
+
+    @classmethod
+    def import_file(cls, file_obj, format='jsonl', batch_size=1000):
+        """
+        Stream articles from a JSON lines or CSV file into `bulk_import`.
+
+        In CSV files the category unique names are separated by commas.
+        """
+        if format == 'jsonl':
+            rows = (json.loads(line) for line in file_obj if line.strip())
+        elif format == 'csv':
+            rows = (
+                dict(
+                    (key, value.decode('utf-8'))
+                    for key, value in row.iteritems()
+                ) for row in csv.DictReader(file_obj)
+            )
+            rows = (
+                dict(row, categories=filter(
+                    None, (row.get('categories') or '').split(',')
+                )) for row in rows
+            )
+        else:
+            raise ValueError('Unknown import format %s' % format)
+        return cls.bulk_import(rows, batch_size=batch_size)
+
+    @classmethod
+    def export_file(cls, file_obj, format='jsonl', domain=None):
+        """
+        Stream the articles matching the domain from `bulk_export` into a
+        JSON lines or CSV file.
+        """
+        rows = cls.bulk_export(domain)
+        if format == 'jsonl':
+            for row in rows:
+                file_obj.write(json.dumps(row) + '\n')
+        elif format == 'csv':
+            writer = csv.DictWriter(
+                file_obj, cls._bulk_fields + ['author', 'categories']
+            )
+            writer.writeheader()
+            for row in rows:
+                row['categories'] = ','.join(row['categories'])
+                writer.writerow(dict(
+                    (key, value.encode('utf-8') if isinstance(value, unicode)
+                        else value)
+                    for key, value in row.iteritems()
+                ))
+        else:
+            raise ValueError('Unknown export format %s' % format)
+
+    @classmethod
+    @route('/article/<uri>', readonly=True)
+    @read_replica
     def render(cls, uri):
         """
         Renders the template
         """
-        try:
-            article, = cls.search([
-                ('uri', '=', uri),
-                ('state', '=', 'published'),
-            ])
-        except ValueError:
+        article_id = cls.get_id_from_uri(uri)
+        if article_id is None:
+            abort(404)
+        article = cls(article_id)
+        cls._view_counter.incr((article.id, datetime.utcnow().date()))
+        note_preload(article.image and article.image.url)
+        if article.banner:
+            note_preload(article.banner.get_image_url())
+        return add_preload_links(surrogate_response(
+            unicode(render_template(article.template, article=article)),
+            [article.surrogate_key]
+        ))
+
+    @classmethod
+    @route('/article/archive/<int:year>/<int:month>', readonly=True)
+    @route(
+        '/article/archive/<int:year>/<int:month>/<int:page>', readonly=True
+    )
+    @read_replica
+    def render_archive(cls, year, month, page=1):
+        """
+        Renders the articles published in a month, most recent first
+        """
+        ArticleArchive = Pool().get('nereid.cms.article.archive')
+
+        # The end of the last month of year 9999 is not a valid date
+        if not (1 <= month <= 12 and date.min.year <= year < date.max.year):
             abort(404)
-        return render_template(article.template, article=article)
+        start, end = ArticleArchive.month_range(year, month)
+        articles = CMSPagination(cls, [
+            ('state', '=', 'published'),
+            ('published_on', '>=', start),
+            ('published_on', '<', end),
+        ], page, 10, order=[('published_on', 'DESC'), ('id', 'DESC')])
+        cls.prefetch_translations(articles.items())
+        return surrogate_response(
+            unicode(render_template(
+                'article-archive.jinja', articles=articles,
+                year=year, month=month,
+            )),
+            [cls.list_surrogate_key()]
+        )
+
+    @classmethod
+    @context_processor('get_article_archive')
+    def get_article_archive(cls, category=None):
+        """
+        Returns the months in which articles (of the category) are published
+        with the number of articles, most recent first::
+
+            [{'year': 2015, 'month': 3, 'count': 12}, ...]
+        """
+        ArticleArchive = Pool().get('nereid.cms.article.archive')
+
+        return [{
+            'year': row.year,
+            'month': row.month,
+            'count': row.count,
+        } for row in ArticleArchive.search([
+            ('category', '=', category and int(category)),
+        ])]
+
+    @classmethod
+    @context_processor('get_popular_articles')
+    def get_popular_articles(cls, category=None, period='week', limit=5):
+        """
+        Returns the most viewed published articles (of the category) over
+        the period (`day`, `week` or `month`), as precomputed by the cron
+        """
+        ArticlePopular = Pool().get('nereid.cms.article.popular')
+
+        rows = ArticlePopular.search([
+            ('period', '=', period),
+            ('category', '=', category and int(category)),
+        ], limit=limit)
+        articles = [row.article for row in rows]
+        cls.prefetch_translations(articles)
+        return articles
 
     @classmethod
-    @route('/sitemaps/article-index.xml')
+    @route('/sitemaps/article-index.xml', readonly=True)
+    @read_replica
     def sitemap_index(cls):
         index = SitemapIndex(cls, [])
         return index.render()
 
     @classmethod
-    @route('/sitemaps/article-<int:page>.xml')
+    @route('/sitemaps/article-<int:page>.xml', readonly=True)
+    @read_replica
     def sitemap(cls, page):
-        sitemap_section = SitemapSection(cls, [], page)
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        content = Artifact.get_or_queue(
+            _request_artifact_key('article-sitemap', page),
+            cls._sitemap_job(page)
+        )
+        response = surrogate_response(
+            content, [cls.list_surrogate_key()], mimetype='application/xml'
+        )
+        response.cache_control.max_age = SitemapSection.cache_timeout
+        response.cache_control.public = True
+        return response
+
+    @classmethod
+    def _sitemap_job(cls, page):
+        return {
+            'key': 'article-sitemap:%d' % page,
+            'model': cls.__name__,
+            'method': 'generate_sitemap',
+            'record': page,
+            'needs_request': True,
+        }
+
+    @classmethod
+    def _sitemap_section(cls, page):
+        sitemap_section = CMSSitemapSection(cls, [], page)
         sitemap_section.changefreq = 'daily'
-        return sitemap_section.render()
+        return sitemap_section
+
+    @classmethod
+    def generate_sitemap(cls, page):
+        """
+        Store the sitemap section of the given page as an artifact. Run by the
+        artifact jobs.
+        """
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        Artifact.generate(
+            _request_artifact_key('article-sitemap', page),
+            lambda: _sitemap_xml(cls._sitemap_section(page))
+        )
 
     @classmethod
     def get_publish_date(cls, records, name):
@@ -871,7 +2589,7 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
 
     def get_menu_item(self, max_depth):
         """
-        Return huge dictionary with serialized article category for menu item
+        Return a MenuNode with the serialized article for menu item
 
         {
             title: <display name>,
@@ -879,11 +2597,7 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
             record: <instance of record>  # if type_ is `record`
         }
         """
-        return {
-            'record': self,
-            'title': self.title,
-            'link': self.get_absolute_url(),
-        }
+        return MenuNode(self.title, self.get_absolute_url(), record=self)
 
     def atom_id(self):
         """
@@ -936,20 +2650,60 @@ class Article(Workflow, ModelSQL, ModelView, CMSMenuItemMixin):
             return super(Article, self).serialize(purpose=purpose)
 
     @classmethod
-    @route('/article/all.atom')
+    @route('/article/all.atom', readonly=True)
+    @read_replica
     def atom_feed(cls):
         """
         Renders the atom feed for all articles.
         """
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        content = Artifact.get_or_queue(
+            _request_artifact_key('article-feed'), cls._feed_job()
+        )
+        return surrogate_response(
+            content, [cls.list_surrogate_key()],
+            mimetype='application/atom+xml'
+        )
+
+    @classmethod
+    def _feed_job(cls):
+        return {
+            'key': 'article-feed',
+            'model': cls.__name__,
+            'method': 'generate_atom_feed',
+            'needs_request': True,
+        }
+
+    @classmethod
+    def build_atom_feed(cls):
+        """
+        Return the atom feed of all the published articles
+        """
         feed = AtomFeed(
-            "All Articles", feed_url=request.url, url=request.host_url
+            "All Articles",
+            feed_url=url_for('nereid.cms.article.atom_feed', _external=True),
+            url=request.host_url
         )
-        for article in cls.search([
+        articles = cls.search([
             ('state', '=', 'published')
-        ]):
+        ])
+        cls.prefetch_translations(articles)
+        for article in articles:
             feed.add(**article.serialize(purpose='atom'))
+        return feed.to_string()
 
-        return feed.get_response()
+    @classmethod
+    def generate_atom_feed(cls):
+        """
+        Store the atom feed of all articles as an artifact. Run by the artifact
+        jobs.
+        """
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        Artifact.generate(
+            _request_artifact_key('article-feed'), cls.build_atom_feed
+        )
 
 
 class ArticleAttribute(ModelSQL, ModelView):
@@ -1073,12 +2827,614 @@ class ArticleCategoryRelation(ModelSQL):
             article = Article.__table__()
             article_categ_rel = cls.__table__()
 
-            article_select = article.select(article.id, article.category)
-            cursor.execute(*article_categ_rel.insert(
-                columns=[article_categ_rel.article, article_categ_rel.category],
-                values=article_select
-            ))
+            # Articles already copied are skipped when resuming
+            copied = article_categ_rel.select(
+                article_categ_rel.id,
+                where=(article_categ_rel.article == article.id) &
+                (article_categ_rel.category == article.category)
+            )
+            _migrate_in_batches(
+                article,
+                (article.category != Null) & ~Exists(copied),
+                lambda where: cursor.execute(*article_categ_rel.insert(
+                    columns=[
+                        article_categ_rel.article, article_categ_rel.category
+                    ],
+                    values=article.select(
+                        article.id, article.category, where=where
+                    )
+                )),
+                'Article categories'
+            )
 
             table.drop_column('category')
 
         super(ArticleCategoryRelation, cls).__register__(module_name)
+
+
+class ArticleRelated(ModelSQL):
+    """
+    Precomputed related articles of a published article
+    """
+    __name__ = 'nereid.cms.article.related'
+
+    article = fields.Many2One(
+        'nereid.cms.article', 'Article', ondelete='CASCADE', required=True,
+        select=True,
+    )
+    related = fields.Many2One(
+        'nereid.cms.article', 'Related Article', ondelete='CASCADE',
+        required=True, select=True,
+    )
+    score = fields.Float('Score', required=True)
+
+
+class ArticleURI(ModelSQL):
+    """
+    URI lookup table of the published articles in every language
+    """
+    __name__ = 'nereid.cms.article.uri'
+
+    article = fields.Many2One(
+        'nereid.cms.article', 'Article', ondelete='CASCADE', required=True,
+        select=True,
+    )
+    language = fields.Char('Language', required=True)
+    uri = fields.Char('URI', required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(ArticleURI, cls).__setup__()
+        cls._sql_constraints += [
+            ('language_uri_uniq', 'UNIQUE(language, uri)',
+                'The URI of a published article must be unique.'),
+        ]
+
+
+class ArticleArchive(ModelSQL):
+    """
+    Number of articles published per month, in total (without category) and
+    per category
+    """
+    __name__ = 'nereid.cms.article.archive'
+
+    year = fields.Integer('Year', required=True, select=True)
+    month = fields.Integer('Month', required=True)
+    category = fields.Many2One(
+        'nereid.cms.article.category', 'Category', ondelete='CASCADE',
+        select=True,
+    )
+    count = fields.Integer('Count', required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(ArticleArchive, cls).__setup__()
+        cls._order = [('year', 'DESC'), ('month', 'DESC')]
+        cls._sql_constraints += [
+            ('category_month_uniq', 'UNIQUE(category, year, month)',
+                'A month is counted once per category.'),
+        ]
+
+    @staticmethod
+    def month_range(year, month):
+        """
+        Return the first day of the month and of the next one
+        """
+        return date(year, month, 1), date(year + month // 12, month % 12 + 1, 1)
+
+    @classmethod
+    def refresh(cls, months):
+        """
+        Count again the published articles of the given (year, month), in
+        total and per category. Only the months touched by a change are
+        counted, with one grouped query each.
+        """
+        pool = Pool()
+        Article = pool.get('nereid.cms.article')
+        Relation = pool.get('nereid.cms.category-article')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        article = Article.__table__()
+        relation = Relation.__table__()
+
+        for year, month in months:
+            start, end = cls.month_range(year, month)
+            cursor.execute(*table.delete(
+                where=(table.year == year) & (table.month == month)
+            ))
+            where = (
+                (article.state == 'published') &
+                (article.published_on >= start) &
+                (article.published_on < end)
+            )
+            cursor.execute(*article.select(Count(article.id), where=where))
+            total, = cursor.fetchone()
+            if not total:
+                continue
+            cursor.execute(*article.join(
+                relation, condition=relation.article == article.id
+            ).select(
+                relation.category, Count(article.id),
+                where=where, group_by=[relation.category]
+            ))
+            values = [[year, month, Null, total]] + [
+                [year, month, category, count]
+                for category, count in cursor.fetchall()
+            ]
+            cursor.execute(*table.insert(
+                columns=[
+                    table.year, table.month, table.category, table.count,
+                    table.create_uid, table.create_date,
+                ],
+                values=[
+                    row + [Transaction().user, CurrentTimestamp()]
+                    for row in values
+                ]
+            ))
+
+
+class ArticleNeighbor(ModelSQL):
+    """
+    Rank and previous and next published articles of a published article in
+    the listing order of a category
+    """
+    __name__ = 'nereid.cms.article.neighbor'
+
+    category = fields.Many2One(
+        'nereid.cms.article.category', 'Category', ondelete='CASCADE',
+        required=True, select=True,
+    )
+    article = fields.Many2One(
+        'nereid.cms.article', 'Article', ondelete='CASCADE', required=True,
+        select=True,
+    )
+    rank = fields.Integer('Rank', required=True)
+    previous = fields.Many2One(
+        'nereid.cms.article', 'Previous Article', ondelete='SET NULL'
+    )
+    next = fields.Many2One(
+        'nereid.cms.article', 'Next Article', ondelete='SET NULL'
+    )
+
+    @classmethod
+    def __setup__(cls):
+        super(ArticleNeighbor, cls).__setup__()
+        cls._sql_constraints += [
+            ('category_article_uniq', 'UNIQUE(category, article)',
+                'An article is listed once per category.'),
+        ]
+
+    @classmethod
+    def refresh(cls, categories):
+        """
+        Rank again the published articles of the given categories (or ids),
+        with one ordered query per category touched by a change
+        """
+        pool = Pool()
+        Article = pool.get('nereid.cms.article')
+        ArticleCategory = pool.get('nereid.cms.article.category')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        ids = list(set(map(int, categories)))
+        if not ids:
+            return
+        for sub_ids in _chunks(ids, cursor.IN_MAX):
+            cursor.execute(*table.delete(where=table.category.in_(sub_ids)))
+
+        values = []
+        for category in ArticleCategory.browse(ids):
+            articles = map(int, Article.search([
+                ('categories', '=', category.id),
+                ('state', '=', 'published'),
+            ], order=category.get_article_order() or None))
+            for rank, article in enumerate(articles):
+                values.append([
+                    category.id, article, rank,
+                    articles[rank - 1] if rank else Null,
+                    articles[rank + 1] if rank + 1 < len(articles) else Null,
+                    Transaction().user, CurrentTimestamp(),
+                ])
+        for sub_values in _chunks(values, 1000):
+            cursor.execute(*table.insert(
+                columns=[
+                    table.category, table.article, table.rank,
+                    table.previous, table.next,
+                    table.create_uid, table.create_date,
+                ],
+                values=sub_values
+            ))
+
+    @classmethod
+    def touch(cls, articles, ranked=()):
+        """
+        Follow the new write date of the written articles in the listings
+        ordered by date of their categories, except the categories of
+        `ranked`. A listing is left as is when the article keeps its place,
+        and the article is moved with a few updates when it goes to the head
+        or the tail of the listing, as written articles do.
+
+        Return the ids of the categories which must be ranked again: the
+        ones listing several of the articles or in which the article moves
+        elsewhere.
+        """
+        listed = {}
+        for article in articles:
+            if article.state != 'published':
+                continue
+            for category in article.categories:
+                if (category.id not in ranked and category.sort_order in (
+                        'recent_first', 'older_first')):
+                    listed.setdefault(category, []).append(article.id)
+
+        reranked = set()
+        for category, article_ids in listed.iteritems():
+            if len(article_ids) > 1 or not cls._move(category, article_ids[0]):
+                reranked.add(category.id)
+        return reranked
+
+    @classmethod
+    def _move(cls, category, article):
+        """
+        Put the article back in its place in the listing of the category
+        ordered by date if it is unchanged, the head or the tail. Return
+        False if the listing must be ranked again.
+        """
+        Article = Pool().get('nereid.cms.article')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        where = table.category == category.id
+
+        cursor.execute(*table.select(
+            table.rank, table.previous, table.next,
+            where=where & (table.article == article)
+        ))
+        row = cursor.fetchone()
+        if row is None:
+            return False
+        rank, previous, next_ = row
+        cursor.execute(*table.select(table.article, where=where & (
+            table.rank == 0
+        )))
+        head, = cursor.fetchone()
+        cursor.execute(*table.select(
+            table.article, table.rank, where=where & (table.next == Null)
+        ))
+        tail, last = cursor.fetchone()
+
+        # The order of the listing: PostgreSQL sorts the missing dates (of
+        # articles never written) after any date, the other backends before
+        null_last = backend.name() == 'postgresql'
+        dates = dict(
+            (values['id'], values['write_date']) for values in Article.read(
+                list(set(
+                    i for i in (previous, next_, head, tail, article) if i
+                )), ['write_date']
+            )
+        )
+
+        def key(article_id):
+            date_ = dates[article_id]
+            return (
+                (date_ is None) == null_last, date_ or datetime.min,
+                article_id
+            )
+        descending = category.sort_order == 'recent_first'
+
+        def before(first, second):
+            return (key(first) > key(second)) == descending
+
+        if ((previous is None or before(previous, article)) and
+                (next_ is None or before(article, next_))):
+            return True
+        if article != head and before(article, head):
+            start, end = head, None
+        elif article != tail and before(tail, article):
+            start, end = None, tail
+        else:
+            return False
+
+        # Unlink the article, then link it at the head or the tail
+        if previous is not None:
+            cursor.execute(*table.update(
+                columns=[table.next], values=[next_ or Null],
+                where=where & (table.article == previous)
+            ))
+        if next_ is not None:
+            cursor.execute(*table.update(
+                columns=[table.previous], values=[previous or Null],
+                where=where & (table.article == next_)
+            ))
+        if start is not None:
+            cursor.execute(*table.update(
+                columns=[table.rank], values=[table.rank + 1],
+                where=where & (table.rank < rank)
+            ))
+            cursor.execute(*table.update(
+                columns=[table.rank, table.previous, table.next],
+                values=[0, Null, start],
+                where=where & (table.article == article)
+            ))
+            cursor.execute(*table.update(
+                columns=[table.previous], values=[article],
+                where=where & (table.article == start)
+            ))
+        else:
+            cursor.execute(*table.update(
+                columns=[table.rank], values=[table.rank - 1],
+                where=where & (table.rank > rank)
+            ))
+            cursor.execute(*table.update(
+                columns=[table.rank, table.previous, table.next],
+                values=[last, end, Null],
+                where=where & (table.article == article)
+            ))
+            cursor.execute(*table.update(
+                columns=[table.next], values=[article],
+                where=where & (table.article == end)
+            ))
+        return True
+
+
+class ArticleView(ModelSQL):
+    """
+    Number of views of an article per day
+    """
+    __name__ = 'nereid.cms.article.view'
+
+    article = fields.Many2One(
+        'nereid.cms.article', 'Article', ondelete='CASCADE', required=True,
+        select=True,
+    )
+    bucket = fields.Date('Day', required=True, select=True)
+    count = fields.Integer('Count', required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(ArticleView, cls).__setup__()
+        cls._sql_constraints += [
+            ('article_bucket_uniq', 'UNIQUE(article, bucket)',
+                'The views of an article are counted once per day.'),
+        ]
+
+    @classmethod
+    def add_counts(cls, counts):
+        """
+        Add the views counted by the workers, a mapping of (article id, day)
+        to a number of views: existing rows are updated and the others are
+        inserted in one statement.
+        """
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        counts = dict(counts)
+        buckets = list(set(bucket for _, bucket in counts))
+        existing = {}
+        for sub_ids in _chunks(set(a for a, _ in counts), cursor.IN_MAX):
+            cursor.execute(*table.select(
+                table.id, table.article, table.bucket,
+                where=table.article.in_(sub_ids) & table.bucket.in_(buckets)
+            ))
+            for id_, article, bucket in cursor.fetchall():
+                if (article, bucket) in counts:
+                    existing[(article, bucket)] = id_
+
+        for key, id_ in existing.iteritems():
+            cursor.execute(*table.update(
+                columns=[table.count], values=[table.count + counts.pop(key)],
+                where=table.id == id_
+            ))
+        for sub_counts in _chunks(counts.iteritems(), 1000):
+            cursor.execute(*table.insert(
+                columns=[
+                    table.article, table.bucket, table.count,
+                    table.create_uid, table.create_date,
+                ],
+                values=[
+                    [article, bucket, count, Transaction().user,
+                        CurrentTimestamp()]
+                    for (article, bucket), count in sub_counts
+                ]
+            ))
+
+
+class ArticlePopular(ModelSQL):
+    """
+    Most viewed published articles over a period, in total (without category)
+    and per category
+    """
+    __name__ = 'nereid.cms.article.popular'
+
+    period = fields.Selection([
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ], 'Period', required=True, select=True)
+    category = fields.Many2One(
+        'nereid.cms.article.category', 'Category', ondelete='CASCADE',
+        select=True,
+    )
+    article = fields.Many2One(
+        'nereid.cms.article', 'Article', ondelete='CASCADE', required=True,
+    )
+    views = fields.Integer('Views', required=True)
+
+    #: Number of days of each period
+    _periods = {'day': 1, 'week': 7, 'month': 30}
+
+    #: Number of articles kept per period and category
+    _limit = 50
+
+    @classmethod
+    def __setup__(cls):
+        super(ArticlePopular, cls).__setup__()
+        cls._order = [('views', 'DESC'), ('id', 'ASC')]
+
+    @classmethod
+    def refresh(cls):
+        """
+        Rank the published articles by their views over each period. Run by
+        the cron.
+        """
+        pool = Pool()
+        Article = pool.get('nereid.cms.article')
+        ArticleView = pool.get('nereid.cms.article.view')
+        Relation = pool.get('nereid.cms.category-article')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        article = Article.__table__()
+        view = ArticleView.__table__()
+        relation = Relation.__table__()
+
+        today = datetime.utcnow().date()
+        cursor.execute(*table.delete())
+        for period, days in cls._periods.iteritems():
+            cursor.execute(*view.join(
+                article, condition=view.article == article.id
+            ).select(
+                view.article, Sum(view.count),
+                where=(view.bucket > today - timedelta(days=days)) &
+                (article.state == 'published'),
+                group_by=[view.article]
+            ))
+            views = dict(cursor.fetchall())
+
+            by_category = {None: views.keys()}
+            for sub_ids in _chunks(views.keys(), cursor.IN_MAX):
+                cursor.execute(*relation.select(
+                    relation.category, relation.article,
+                    where=relation.article.in_(sub_ids)
+                ))
+                for category, article_id in cursor.fetchall():
+                    by_category.setdefault(category, []).append(article_id)
+
+            values = []
+            for category, article_ids in by_category.iteritems():
+                values.extend(
+                    [period, category, article_id, views[article_id],
+                        Transaction().user, CurrentTimestamp()]
+                    for article_id in heapq.nlargest(
+                        cls._limit, article_ids, key=views.get
+                    )
+                )
+            for sub_values in _chunks(values, 1000):
+                cursor.execute(*table.insert(
+                    columns=[
+                        table.period, table.category, table.article,
+                        table.views, table.create_uid, table.create_date,
+                    ],
+                    values=sub_values
+                ))
+
+
+class BannerStat(ModelSQL):
+    """
+    Impressions and clicks of a banner per day
+    """
+    __name__ = 'nereid.cms.banner.stat'
+
+    banner = fields.Many2One(
+        'nereid.cms.banner', 'Banner', ondelete='CASCADE', required=True,
+        select=True,
+    )
+    bucket = fields.Date('Day', required=True, select=True)
+    impressions = fields.Integer('Impressions', required=True)
+    clicks = fields.Integer('Clicks', required=True)
+
+    @classmethod
+    def __setup__(cls):
+        super(BannerStat, cls).__setup__()
+        cls._sql_constraints += [
+            ('banner_bucket_uniq', 'UNIQUE(banner, bucket)',
+                'The impressions and clicks of a banner are counted once '
+                'per day.'),
+        ]
+
+    @classmethod
+    def add_counts(cls, counts):
+        """
+        Add the counts of the workers, a mapping of (banner id, day,
+        `impressions` or `clicks`) to a number: existing rows are updated and
+        the others are inserted in one statement per batch.
+        """
+        cursor = Transaction().cursor
+        table = cls.__table__()
+
+        rows = {}
+        for (banner, bucket, name), count in counts.iteritems():
+            rows.setdefault(
+                (banner, bucket), {'impressions': 0, 'clicks': 0}
+            )[name] += count
+
+        buckets = list(set(bucket for _, bucket in rows))
+        existing = {}
+        for sub_ids in _chunks(set(b for b, _ in rows), cursor.IN_MAX):
+            cursor.execute(*table.select(
+                table.id, table.banner, table.bucket,
+                where=table.banner.in_(sub_ids) & table.bucket.in_(buckets)
+            ))
+            for id_, banner, bucket in cursor.fetchall():
+                if (banner, bucket) in rows:
+                    existing[(banner, bucket)] = id_
+
+        for key, id_ in existing.iteritems():
+            counted = rows.pop(key)
+            cursor.execute(*table.update(
+                columns=[table.impressions, table.clicks],
+                values=[
+                    table.impressions + counted['impressions'],
+                    table.clicks + counted['clicks'],
+                ],
+                where=table.id == id_
+            ))
+        for sub_rows in _chunks(rows.iteritems(), 1000):
+            cursor.execute(*table.insert(
+                columns=[
+                    table.banner, table.bucket, table.impressions,
+                    table.clicks, table.create_uid, table.create_date,
+                ],
+                values=[
+                    [banner, bucket, row['impressions'], row['clicks'],
+                        Transaction().user, CurrentTimestamp()]
+                    for (banner, bucket), row in sub_rows
+                ]
+            ))
+
+
+class Translation:
+    __name__ = 'ir.translation'
+
+    @staticmethod
+    def _article_uri_ids(translations):
+        """
+        Return the ids of the articles of the uri translations
+        """
+        return list(set(
+            t.res_id for t in translations
+            if t.name == 'nereid.cms.article,uri' and t.res_id >= 0
+        ))
+
+    @classmethod
+    def create(cls, vlist):
+        Article = Pool().get('nereid.cms.article')
+
+        translations = super(Translation, cls).create(vlist)
+        Article.refresh_uri_index(cls._article_uri_ids(translations))
+        return translations
+
+    @classmethod
+    def write(cls, *args):
+        Article = Pool().get('nereid.cms.article')
+
+        super(Translation, cls).write(*args)
+        Article.refresh_uri_index(
+            cls._article_uri_ids(sum(map(list, args[::2]), []))
+        )
+
+    @classmethod
+    def delete(cls, translations):
+        Article = Pool().get('nereid.cms.article')
+
+        article_ids = cls._article_uri_ids(translations)
+        super(Translation, cls).delete(translations)
+        Article.refresh_uri_index(article_ids)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Counters
+    counter.py
+
+    Counters incremented by page views (article views, banner impressions
+    and clicks) are accumulated in the memory of each worker and written to
+    the database in batches, so that counting adds no write to the requests.
+
+    The first count of a worker in a database starts a thread flushing the
+    counters of the database every `counter_flush_interval` seconds, so that
+    the counts of idle workers are written too.
+
+'''
+import os
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from trytond.config import config
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+
+__all__ = ['BufferedCounter', 'start_counter_flusher']
+
+logger = logging.getLogger('nereid_cms.counter')
+
+#: Every counter of the worker, flushed by `start_counter_flusher`
+COUNTERS = []
+
+# The flusher threads started, by process and database: a worker forked
+# after counting starts its own
+_flushers = {}
+_flushers_lock = threading.Lock()
+
+
+class BufferedCounter(object):
+    """
+    In-memory counters of a worker, flushed to the database by the
+    `add_counts(counts)` classmethod of the model once `counter_flush_size`
+    keys are counted or every `counter_flush_interval` seconds (options of
+    the `nereid_cms` configuration section).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        # Counts and time of the last flush per database, as a worker may
+        # serve several databases
+        self._counts = defaultdict(Counter)
+        self._flushed_at = {}
+        self._lock = threading.Lock()
+        COUNTERS.append(self)
+
+    def incr(self, key, value=1):
+        """
+        Count `value` for the key in the database of the transaction, and
+        flush the counters of the database if they are due
+        """
+        database_name = Transaction().cursor.database_name
+        size = config.getint('nereid_cms', 'counter_flush_size', default=1000)
+        interval = config.getint(
+            'nereid_cms', 'counter_flush_interval', default=60
+        )
+        with self._lock:
+            counts = self._counts[database_name]
+            counts[key] += value
+            flushed_at = self._flushed_at.setdefault(
+                database_name, time.time()
+            )
+            due = len(counts) >= size or time.time() - flushed_at >= interval
+        if due:
+            self.flush()
+        _start_flusher(database_name, Transaction().user, interval)
+
+    def pending(self):
+        """
+        Return a copy of the counts of the database of the transaction not
+        flushed yet
+        """
+        database_name = Transaction().cursor.database_name
+        with self._lock:
+            return Counter(self._counts.get(database_name, {}))
+
+    def clear(self):
+        """
+        Drop the counts not flushed yet of every database
+        """
+        with self._lock:
+            self._counts.clear()
+            self._flushed_at.clear()
+
+    def flush(self):
+        """
+        Write the counts of the database of the transaction in a transaction
+        of their own, so that they do not depend on the outcome of the
+        request. Counts which could not be written are kept for the next
+        flush.
+        """
+        database_name = Transaction().cursor.database_name
+        with self._lock:
+            counts = self._counts.pop(database_name, None)
+            self._flushed_at[database_name] = time.time()
+        if not counts:
+            return
+        Model = Pool().get(self.model)
+        try:
+            with Transaction().new_cursor() as transaction:
+                Model.add_counts(counts)
+                transaction.cursor.commit()
+        except Exception:
+            logger.exception('Flush of %s counters failed', self.model)
+            with self._lock:
+                self._counts[database_name].update(counts)
+
+
+def start_counter_flusher(database_name, user, interval=60):
+    """
+    Start a daemon thread flushing the counters of the worker every
+    `interval` seconds, so that the counts of idle workers are written too.
+    Started by the first count of the worker in the database.
+    """
+    def work():
+        while True:
+            time.sleep(interval)
+            try:
+                with Transaction().start(database_name, user):
+                    for counter in COUNTERS:
+                        counter.flush()
+            except Exception:
+                logger.exception('Counter flush failed')
+
+    thread = threading.Thread(target=work, name='nereid-cms-counters')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def _start_flusher(database_name, user, interval):
+    """
+    Start the flusher of the counters of the database in the process, unless
+    it is already running
+    """
+    key = (os.getpid(), database_name)
+    with _flushers_lock:
+        if key not in _flushers:
+            _flushers[key] = start_counter_flusher(
+                database_name, user, interval
+            )
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Static Export
+    export.py
+
+    Render the published CMS content (articles, category pages, feeds and
+    sitemaps) of every website into a directory tree that a plain web server
+    can serve::
+
+        python -m trytond.modules.nereid_cms.export -a wsgi:create_app \\
+            -o /var/www/static-cms --incremental
+
+    The application is created by the given factory (`module:function`) in
+    every process of the pool rendering the pages. The pages of the articles
+    which are no longer published are removed from the directory, and the
+    pages of their categories are rendered again.
+
+'''
+import os
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+from importlib import import_module
+from multiprocessing import Pool as ProcessPool
+
+from trytond import backend
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+from nereid.helpers import url_for
+from nereid.contrib.sitemap import SitemapSection
+
+__all__ = ['export_site']
+
+logger = logging.getLogger('nereid_cms.export')
+
+#: File of the export directory holding the time of the last export
+STAMP_FILE = '.nereid-cms-export'
+
+#: File of the export directory holding the pages of the last export, the
+#: categories of its articles and the pages which could not be rendered,
+#: per website
+MANIFEST_FILE = '.nereid-cms-export.json'
+
+#: The application of the rendering process
+_app = None
+
+
+def _load_app(app_path):
+    module_name, factory = app_path.split(':')
+    return getattr(import_module(module_name), factory)()
+
+
+def _init_worker(app_path):
+    global _app
+    _app = _load_app(app_path)
+
+
+def _page_file(output, website, path):
+    """
+    Return the file of the page at the url path: pages without an
+    extension are stored as the index.html of a directory
+    """
+    path = path.strip('/')
+    if not os.path.splitext(path)[1]:
+        path = os.path.join(path, 'index.html')
+    return os.path.join(output, website, path)
+
+
+def _render_page(task):
+    """
+    Render a page with the application of the process and store it.
+    Return the website, the path and the status code of the response.
+    """
+    output, website, path = task
+    with _app.test_client() as client:
+        response = client.get(path, base_url='http://%s/' % website)
+    if response.status_code == 200:
+        filename = _page_file(output, website, path)
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(filename, 'wb') as page:
+            page.write(response.data)
+    return website, path, response.status_code
+
+
+def _changed(records, since):
+    """
+    Return the records created or written since the given time
+    """
+    if since is None:
+        return records
+    return [
+        record for record in records
+        if (record.write_date or record.create_date) > since
+    ]
+
+
+def list_pages(since=None, categories=()):
+    """
+    Return the url paths to render for the website of the current request.
+    With `since`, only the pages of the articles and categories changed
+    since then, or of the categories whose unique names are given, are
+    listed; feeds and sitemaps are always listed.
+    """
+    pool = Pool()
+    Article = pool.get('nereid.cms.article')
+    ArticleCategory = pool.get('nereid.cms.article.category')
+
+    articles = Article.search([('state', '=', 'published')])
+    changed_articles = _changed(articles, since)
+    paths = [article.get_absolute_url() for article in changed_articles]
+
+    changed_ids = set(map(int, changed_articles))
+    for category in ArticleCategory.search([]):
+        published = category.published_articles
+        if (not _changed([category], since) and
+                category.unique_name not in categories and
+                not changed_ids.intersection(map(int, published))):
+            continue
+        pages = max(
+            (len(published) - 1) // category.articles_per_page + 1, 1
+        )
+        paths.append(category.get_absolute_url())
+        paths.extend(
+            url_for(
+                'nereid.cms.article.category.render',
+                uri=category.unique_name, page=page
+            ) for page in xrange(2, pages + 1)
+        )
+        paths.append(url_for(
+            'nereid.cms.article.category.atom_feed', uri=category.unique_name
+        ))
+
+    paths.append(url_for('nereid.cms.article.atom_feed'))
+    paths.extend(
+        url_for('nereid.user.atom_feed', id=author.id)
+        for author in set(a.author for a in articles if a.author)
+    )
+    paths.append(url_for('nereid.cms.article.sitemap_index'))
+    paths.append(url_for('nereid.cms.article.category.sitemap_index'))
+    for model in (Article, ArticleCategory):
+        last = model.search([], order=[('id', 'DESC')], limit=1)
+        pages = (last[0].id - 1) // SitemapSection.batch_size + 1 if last else 0
+        paths.extend(
+            url_for('%s.sitemap' % model.__name__, page=page)
+            for page in xrange(1, pages + 1)
+        )
+    return paths
+
+
+def article_categories():
+    """
+    Return the pages of the published articles of the website of the
+    current request, with the unique names of their categories
+    """
+    Article = Pool().get('nereid.cms.article')
+
+    return dict(
+        (article.get_absolute_url(), [
+            category.unique_name for category in article.categories
+        ]) for article in Article.search([('state', '=', 'published')])
+    )
+
+
+def removed_pages(previous, pages, articles):
+    """
+    Return the pages of the previous export (an entry of the manifest) which
+    are no longer listed in `pages`, and the unique names of the categories
+    which lost articles: the categories of the articles no longer published,
+    or no longer in `articles` (see `article_categories`)
+    """
+    removed = set(previous.get('pages', [])) - set(pages)
+    categories = set()
+    for path, names in previous.get('articles', {}).iteritems():
+        categories.update(set(names) - set(articles.get(path, [])))
+    return removed, categories
+
+
+def _remove_page(output, website, path):
+    filename = _page_file(output, website, path)
+    try:
+        os.remove(filename)
+    except OSError:
+        pass
+
+
+def export_site(app_path, output, processes=None, incremental=False):
+    """
+    Render the CMS pages of every website into the output directory, with a
+    pool of `processes` processes (one per CPU by default).
+
+    In incremental mode only the pages of the records changed since the
+    last export into the directory, and of the categories of the articles
+    which are no longer published, are rendered again, as are the pages
+    which could not be rendered by the last export. The pages which are no
+    longer listed are removed in both modes.
+    """
+    app = _load_app(app_path)
+    stamp_file = os.path.join(output, STAMP_FILE)
+    manifest_file = os.path.join(output, MANIFEST_FILE)
+
+    since = None
+    if incremental and os.path.exists(stamp_file):
+        with open(stamp_file) as stamp:
+            since = datetime.utcfromtimestamp(float(stamp.read()))
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as previous:
+            manifest = json.load(previous)
+    started = time.time()
+
+    tasks = []
+    with Transaction().start(app.database_name, 0):
+        Website = Pool(app.database_name).get('nereid.website')
+        for website in Website.search([]):
+            with app.test_request_context(
+                    '/', base_url='http://%s/' % website.name):
+                listed, articles = list_pages(), article_categories()
+                previous = manifest.get(website.name, {})
+                removed, categories = removed_pages(
+                    previous, listed, articles
+                )
+                pages = listed
+                if since is not None:
+                    pages = list_pages(since, categories)
+                    pages += sorted(
+                        set(previous.get('failed', [])) & set(listed) -
+                        set(pages)
+                    )
+                tasks.extend((output, website.name, path) for path in pages)
+                for path in removed:
+                    _remove_page(output, website.name, path)
+                manifest[website.name] = {
+                    'pages': listed,
+                    'articles': articles,
+                    'failed': [],
+                }
+
+    # The connections of the process must not be shared with the rendering
+    # processes forked from it, which open their own
+    backend.get('Database')(app.database_name).close()
+
+    process_pool = ProcessPool(processes, _init_worker, (app_path,))
+    try:
+        failed = [
+            (website, path, status) for website, path, status in
+            process_pool.imap_unordered(_render_page, tasks, chunksize=16)
+            if status != 200
+        ]
+    finally:
+        process_pool.close()
+        process_pool.join()
+    for website, path, status in failed:
+        logger.warning('%s could not be exported (%s)', path, status)
+        # Rendered again by the next export
+        manifest[website]['failed'].append(path)
+
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    with open(stamp_file, 'w') as stamp:
+        stamp.write(repr(started))
+    with open(manifest_file, 'w') as current:
+        json.dump(manifest, current)
+    return len(tasks) - len(failed), failed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='Export the published CMS content as static files'
+    )
+    parser.add_argument(
+        '-a', '--app', dest='app', required=True,
+        help='Factory of the nereid application, as module:function'
+    )
+    parser.add_argument('-o', '--output', dest='output', required=True)
+    parser.add_argument(
+        '-p', '--processes', dest='processes', type=int, default=None
+    )
+    parser.add_argument(
+        '-i', '--incremental', dest='incremental', action='store_true',
+        help='Only render the records changed since the last export'
+    )
+    options = parser.parse_args(args)
+
+    exported, failed = export_site(
+        options.app, options.output, options.processes, options.incremental
+    )
+    logger.info('%d pages exported, %d failed', exported, len(failed))
+
+
+if __name__ == '__main__':
+    main()
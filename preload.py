@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Preload
+    preload.py
+
+    Images rendered at the top of CMS pages (banners, article images) are
+    announced in `Link: <url>; rel=preload` headers, so that browsers (and
+    CDNs turning them into 103 Early Hints) start fetching them before the
+    HTML is parsed.
+
+    103 Early Hints are not sent by the application itself: WSGI has no way
+    to send an interim response, and the resources are only known once the
+    page is rendered, right before the final response is sent anyway.
+
+'''
+from flask import g
+from trytond.config import config
+from nereid.ctx import has_request_context
+
+__all__ = ['note_preload', 'add_preload_links']
+
+
+def note_preload(url, as_='image'):
+    """
+    Record a resource rendered by the current request to announce in a
+    preload link. Only the first resources noted (the ones rendered above
+    the fold) are kept, up to the `preload_limit` option of the `nereid_cms`
+    configuration section (3 by default).
+    """
+    if not url or not has_request_context():
+        return
+    if not hasattr(g, 'preload_links'):
+        g.preload_links = []
+    limit = config.getint('nereid_cms', 'preload_limit', default=3)
+    if len(g.preload_links) < limit and (url, as_) not in g.preload_links:
+        g.preload_links.append((url, as_))
+
+
+def add_preload_links(response):
+    """
+    Add a Link header to the response for each resource noted during the
+    request, and return the response
+    """
+    for url, as_ in getattr(g, 'preload_links', []):
+        response.headers.add('Link', '<%s>; rel=preload; as=%s' % (url, as_))
+    return response
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Purge
+    purge.py
+
+    CMS responses carry Surrogate-Key/Cache-Tag headers listing the records
+    they were rendered from. Writing those records queues purge events which
+    are sent in batches to a pluggable sink (a CDN purge endpoint, a log...).
+
+'''
+import logging
+import urllib2
+
+from flask import g
+from werkzeug.wrappers import Response
+from nereid.ctx import has_request_context
+from trytond.config import config
+from trytond.model import ModelSQL, fields
+from trytond.pool import PoolMeta
+from trytond.transaction import Transaction
+
+__all__ = ['Purge']
+__metaclass__ = PoolMeta
+
+logger = logging.getLogger('nereid_cms.purge')
+
+
+class PurgeSink(object):
+    """
+    Receives the surrogate keys of the content to purge from caches
+    """
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class LogPurgeSink(PurgeSink):
+    """
+    Logs the surrogate keys to purge
+    """
+
+    def purge(self, keys):
+        logger.info('Purge %s', ' '.join(keys))
+
+
+class HTTPPurgeSink(PurgeSink):
+    """
+    Sends the surrogate keys (a list) to purge to an HTTP endpoint, in POST
+    requests carrying at most `batch_size` keys in their Surrogate-Key header
+    """
+    batch_size = 256
+
+    def __init__(self, url, token=None, timeout=10):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def purge(self, keys):
+        for index in xrange(0, len(keys), self.batch_size):
+            batch = keys[index:index + self.batch_size]
+            headers = {'Surrogate-Key': ' '.join(batch)}
+            if self.token:
+                headers['Authorization'] = 'Bearer %s' % self.token
+            urllib2.urlopen(
+                urllib2.Request(self.url, data='', headers=headers),
+                timeout=self.timeout
+            ).read()
+
+
+#: Factories of the purge sinks, by the name used in the `purge_sink`
+#: option of the `nereid_cms` configuration section
+SINKS = {
+    'log': LogPurgeSink,
+    'http': lambda: HTTPPurgeSink(
+        config.get('nereid_cms', 'purge_url'),
+        config.get('nereid_cms', 'purge_token'),
+    ),
+}
+
+
+def register_sink(name, factory):
+    """
+    Register a purge sink factory under the given name
+    """
+    SINKS[name] = factory
+
+
+def get_sink():
+    """
+    Return the purge sink configured for the deployment (`log` by default)
+    """
+    return SINKS[config.get('nereid_cms', 'purge_sink', default='log')]()
+
+
+def note_surrogate_keys(keys):
+    """
+    Record surrogate keys of records used while rendering the response of
+    the current request
+    """
+    if not has_request_context():
+        return
+    if not hasattr(g, 'surrogate_keys'):
+        g.surrogate_keys = set()
+    g.surrogate_keys.update(keys)
+
+
+def surrogate_response(content, keys=(), **kwargs):
+    """
+    Return a response with the content and Surrogate-Key and Cache-Tag
+    headers listing the given keys and the keys noted during the request
+    """
+    kwargs.setdefault('mimetype', 'text/html')
+    response = Response(content, **kwargs)
+    keys = sorted(set(keys) | getattr(g, 'surrogate_keys', set()))
+    if keys:
+        response.headers['Surrogate-Key'] = ' '.join(keys)
+        response.headers['Cache-Tag'] = ','.join(keys)
+    return response
+
+
+class Purge(ModelSQL):
+    "CMS Cache Purge"
+    __name__ = 'nereid.cms.purge'
+
+    key = fields.Char('Surrogate Key', required=True, select=True)
+
+    @classmethod
+    def queue(cls, keys):
+        """
+        Queue the purge of the given surrogate keys, skipping the ones
+        already queued. Keys are not unique in the table: concurrent
+        transactions may queue the same key, which is then sent once.
+        """
+        # cms.py imports this module
+        from .cms import _chunks
+
+        keys = set(keys)
+        if not keys:
+            return
+        queued = set()
+        for chunk in _chunks(keys, Transaction().cursor.IN_MAX):
+            queued.update(
+                purge.key for purge in cls.search([('key', 'in', chunk)])
+            )
+        cls.create([{'key': key} for key in keys - queued])
+
+    @classmethod
+    def flush(cls):
+        """
+        Send every queued key to the purge sink in one batch. Run by the cron,
+        so that only committed changes are purged.
+        """
+        purges = cls.search([])
+        if purges:
+            get_sink().purge(sorted(set(purge.key for purge in purges)))
+            cls.delete(purges)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Content Renderers
+    renderer.py
+
+    Registry of the formats articles can be written in. The library of each
+    format is imported the first time an article in that format is rendered,
+    so workers do not pay for docutils or markdown unless they use them.
+
+    Deployments add or replace formats without touching `Article`::
+
+        register_renderer('markdown', 'Markdown', 'commonmark:commonmark')
+
+'''
+import time
+import logging
+from importlib import import_module
+from pkgutil import find_loader
+from collections import OrderedDict
+
+__all__ = [
+    'ContentRenderer', 'register_renderer', 'get_renderer',
+    'available_renderers', 'renderer_stats',
+]
+
+logger = logging.getLogger('nereid_cms.renderer')
+
+
+class ContentRenderer(object):
+    """
+    Render text of one format to html with a function given by its dotted
+    path (`module:function`), imported on first use. `requires` is the
+    library the renderer needs, the module of the function by default.
+    """
+
+    def __init__(self, name, label, path, requires=None):
+        self.name = name
+        self.label = label
+        self.path = path
+        if requires is None and path is not None:
+            requires = path.split(':')[0]
+        self.requires = requires
+        self._render = None
+        self.calls = 0
+        self.duration = 0.0
+
+    def is_available(self):
+        """
+        Tell whether the library of the renderer is installed, without
+        importing it
+        """
+        if self.requires is None:
+            return True
+        try:
+            return find_loader(self.requires) is not None
+        except ImportError:
+            return False
+
+    def load(self):
+        if self._render is None:
+            if self.path is None:
+                self._render = lambda text: text
+            else:
+                module_name, function = self.path.split(':')
+                self._render = getattr(import_module(module_name), function)
+        return self._render
+
+    def render(self, text):
+        render = self.load()
+        start = time.time()
+        try:
+            return render(text)
+        finally:
+            duration = time.time() - start
+            self.calls += 1
+            self.duration += duration
+            logger.debug('%s rendered in %.2f ms', self.name, duration * 1000)
+
+
+def render_rst(text):
+    """
+    Render reStructuredText with docutils
+    """
+    from docutils.core import publish_parts
+    return publish_parts(text, writer_name='html')['html_body']
+
+
+#: The renderers by content type, in the order of the selection
+RENDERERS = OrderedDict()
+
+
+def register_renderer(name, label, path, requires=None):
+    """
+    Register (or replace) the renderer of a content type. `path` is the
+    dotted path of a function rendering text to html, as `module:function`,
+    or None for content which is already html.
+    """
+    RENDERERS[name] = ContentRenderer(name, label, path, requires)
+
+
+def get_renderer(name):
+    """
+    Return the renderer of the content type or None if it is unknown
+    """
+    return RENDERERS.get(name)
+
+
+def available_renderers():
+    """
+    Return the renderers whose library is installed
+    """
+    return [r for r in RENDERERS.itervalues() if r.is_available()]
+
+
+def renderer_stats():
+    """
+    Return the number of calls and the total time spent (in seconds) by
+    each renderer of the worker
+    """
+    return dict(
+        (r.name, {'calls': r.calls, 'duration': r.duration})
+        for r in RENDERERS.itervalues()
+    )
+
+
+register_renderer('html', 'HTML', None)
+register_renderer('plain', 'Plain Text', None)
+register_renderer('markdown', 'Markdown', 'markdown:markdown')
+register_renderer(
+    'rst', 'reStructured TeXT', __name__ + ':render_rst', requires='docutils'
+)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Read Replica
+    replica.py
+
+    Public CMS routes only read, so they can be served from a read replica
+    of the database when the `nereid_cms` configuration section defines
+    one::
+
+        [nereid_cms]
+        replica_uri = postgresql://reader@replica-host:5432/
+        # or, for SQLite, the directory of the replica files
+        replica_path = /var/lib/trytond-replica
+
+'''
+import os
+import urllib
+import logging
+import threading
+from functools import wraps
+
+from trytond import backend
+from trytond.config import config, parse_uri
+from trytond.transaction import Transaction
+
+__all__ = ['replica_database', 'read_replica']
+
+logger = logging.getLogger('nereid_cms.replica')
+
+_replicas = {}
+_lock = threading.Lock()
+
+
+def _replica_class(uri, path):
+    """
+    Return a Database class of the backend connecting to the replica, whose
+    location is given to it rather than read from the `database` section of
+    the configuration, which the primary connections keep reading
+    """
+    Database = backend.get('Database')
+
+    class Replica(Database):
+        # Connections to the replica are not shared with the primary
+        _databases = {}
+        _connpool = None
+        _conn = None
+
+        def connect(self):
+            if backend.name() == 'sqlite':
+                # The file of the database is joined to the configured path,
+                # unless it is absolute
+                database_name = self.database_name
+                self.database_name = os.path.join(path, database_name)
+                try:
+                    return super(Replica, self).connect()
+                finally:
+                    self.database_name = database_name
+            if self._connpool is not None:
+                return self
+            from psycopg2.pool import ThreadedConnectionPool
+            parsed = parse_uri(uri)
+            dsn = ' '.join(
+                '%s=%s' % (key, value) for key, value in [
+                    ('host', parsed.hostname),
+                    ('port', parsed.port),
+                    ('dbname', self.database_name),
+                    ('user', parsed.username),
+                    ('password', parsed.password and
+                        urllib.unquote_plus(parsed.password)),
+                ] if value
+            )
+            self._connpool = ThreadedConnectionPool(
+                config.getint('database', 'minconn', 1),
+                config.getint('database', 'maxconn', 64),
+                dsn
+            )
+            return self
+    return Replica
+
+
+def replica_database(database_name):
+    """
+    Return the connected replica of the database, or None if no replica is
+    configured
+    """
+    uri = config.get('nereid_cms', 'replica_uri')
+    path = config.get('nereid_cms', 'replica_path')
+    if not uri and not path:
+        return None
+
+    with _lock:
+        if database_name not in _replicas:
+            Replica = _replica_class(uri, path)
+            _replicas[database_name] = Replica(database_name).connect()
+            logger.info('connected to the replica of "%s"', database_name)
+    return _replicas[database_name]
+
+
+def read_replica(function):
+    """
+    Run the decorated route with a read only cursor on the replica of the
+    database if one is configured, in READ COMMITTED on PostgreSQL. The
+    route must not write and must render its response before returning.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        database = replica_database(Transaction().cursor.database_name)
+        if database is None:
+            return function(*args, **kwargs)
+        cursor = database.cursor(readonly=True)
+        if backend.name() == 'postgresql':
+            # Each query of the route reads the last committed rows, without
+            # keeping a snapshot for the whole transaction
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL READ COMMITTED')
+        try:
+            with Transaction().set_cursor(cursor):
+                return function(*args, **kwargs)
+        finally:
+            cursor.close()
+    return wrapper
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Single-flight
+    singleflight.py
+
+    Until the artifact of a feed or a sitemap is stored, every artifact
+    worker running its job would build the same document. Builds of a
+    document are serialised by a lock file shared by the threads and
+    processes of the host: one worker builds it while the others are given
+    the previous copy, or wait for the builder if there is none. A copy
+    written less than `single_flight_ttl` seconds ago is returned without
+    building the document again::
+
+        [nereid_cms]
+        # directory of the lock files and of the copies of the documents
+        lock_path = /var/run/nereid-cms
+        # seconds to wait for a builder before building anyway
+        single_flight_wait = 5
+        # seconds during which a copy is returned without building again
+        single_flight_ttl = 10
+
+    The copy and the lock file of a document are removed by `discard` once
+    its artifact is stored or invalidated, so that no stale copy is served.
+
+'''
+import os
+import time
+import errno
+import fcntl
+import hashlib
+import logging
+import tempfile
+import threading
+
+from trytond.config import config
+
+__all__ = ['single_flight', 'discard']
+
+logger = logging.getLogger('nereid_cms.singleflight')
+
+
+def _copy_file(key):
+    """
+    Return the file holding the last copy of the document of the key
+    """
+    path = config.get(
+        'nereid_cms', 'lock_path',
+        default=os.path.join(tempfile.gettempdir(), 'nereid-cms')
+    )
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    return os.path.join(path, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def _read_copy(filename):
+    try:
+        with open(filename, 'rb') as copy:
+            return copy.read().decode('utf-8')
+    except IOError:
+        return None
+
+
+def _fresh_copy(filename, ttl):
+    """
+    Return the copy if it was written less than `ttl` seconds ago
+    """
+    try:
+        if time.time() - os.stat(filename).st_mtime >= ttl:
+            return None
+    except OSError:
+        return None
+    return _read_copy(filename)
+
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+
+
+def _write_copy(filename, content):
+    if isinstance(content, unicode):
+        content = content.encode('utf-8')
+    # Readers never see a partial copy
+    temp = '%s.%d.%d' % (
+        filename, os.getpid(), threading.current_thread().ident
+    )
+    with open(temp, 'wb') as copy:
+        copy.write(content)
+    os.rename(temp, filename)
+
+
+def _acquire(lock, filename, deadline):
+    """
+    Take the lock of the document, waiting for its builder at most until the
+    deadline. Return whether the builder was waited for, and None once the
+    lock is taken, the previous copy to return instead when there is one, or
+    False if the deadline passed.
+    """
+    waited = False
+    while True:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return waited, None
+        except IOError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+        if not waited:
+            stale = _read_copy(filename)
+            if stale is not None:
+                return waited, stale
+        if time.time() >= deadline:
+            return waited, False
+        waited = True
+        time.sleep(0.05)
+
+
+def _is_current(lock, filename):
+    """
+    Return whether the open lock is still the lock file of the document,
+    which `discard` may have removed since it was opened
+    """
+    try:
+        return os.fstat(lock.fileno()).st_ino == os.stat(filename).st_ino
+    except OSError:
+        return False
+
+
+def single_flight(key, build):
+    """
+    Return the document of the key built by `build()`, which runs in one
+    thread or process of the host at a time. The key is shared by every
+    database served by the host.
+
+    A copy written less than `single_flight_ttl` seconds ago is returned as
+    is. While the document is being built, the previous copy is returned if
+    there is one. Otherwise the copy of the builder is waited for, at most
+    `single_flight_wait` seconds after which the document is built anyway.
+    """
+    filename = _copy_file(key)
+    wait = config.getfloat('nereid_cms', 'single_flight_wait', default=5)
+    ttl = config.getfloat('nereid_cms', 'single_flight_ttl', default=10)
+
+    content = _fresh_copy(filename, ttl)
+    if content is not None:
+        return content
+
+    deadline = time.time() + wait
+    while True:
+        with open(filename + '.lock', 'a') as lock:
+            waited, content = _acquire(lock, filename, deadline)
+            if content is False:
+                logger.warning('%s built without waiting any longer', key)
+                return build()
+            if content is not None:
+                return content
+
+            try:
+                if not _is_current(lock, filename + '.lock'):
+                    # Discarded meanwhile: lock the new file
+                    continue
+                if waited:
+                    content = _read_copy(filename)
+                    if content is not None:
+                        return content
+                content = build()
+                _write_copy(filename, content)
+                return content
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def discard(key):
+    """
+    Remove the copy of the document of the key, and its lock file unless
+    the document is being built
+    """
+    filename = _copy_file(key)
+    _remove(filename)
+    try:
+        lock = open(filename + '.lock', 'r')
+    except IOError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+        return
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except IOError as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            return
+        try:
+            _remove(filename + '.lock')
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Templating
+    templating.py
+
+'''
+import threading
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from trytond.cache import Cache
+from trytond.transaction import Transaction
+from nereid import request
+from nereid.ctx import has_request_context
+
+__all__ = ['CMSCacheExtension', 'fragment_key', 'clear_fragments']
+
+# The fragments depending on the records of each model, by model name. A
+# fragment is stored in the cache of every model it depends on and only
+# served while it is in all of them.
+_fragment_caches = {}
+_fragment_caches_lock = threading.Lock()
+
+
+def _fragment_cache(model):
+    with _fragment_caches_lock:
+        if model not in _fragment_caches:
+            _fragment_caches[model] = Cache(
+                'nereid.cms.fragment.%s' % model, size_limit=2048,
+                context=False
+            )
+        return _fragment_caches[model]
+
+
+def clear_fragments(models):
+    """
+    Drop the cached fragments depending on the given models, in every worker
+    """
+    for model in set(models):
+        _fragment_cache(model).clear()
+
+
+def _flatten(records):
+    for record in records:
+        if isinstance(record, (list, tuple)):
+            for sub_record in _flatten(record):
+                yield sub_record
+        elif record is not None:
+            yield record
+
+
+def fragment_key(name, records):
+    """
+    Return the cache key of a fragment depending on the given records.
+
+    The key contains the last modification time of each record, so writing
+    any of them (or adding and removing records from the list) leads to a
+    new key and the old fragment is never served again. The language of the
+    transaction and the website of the request are part of the key too.
+    """
+    versions = tuple(
+        (record.__name__, record.id, record.create_date, record.write_date)
+        for record in _flatten(records) if not isinstance(record, basestring)
+    )
+    website = request.nereid_website.id if has_request_context() else None
+    return (name, Transaction().language, website, versions)
+
+
+def _fragment_models(records):
+    """
+    Return the names of the models a fragment depending on the given records
+    (or model names) depends on
+    """
+    return sorted(set(
+        record if isinstance(record, basestring) else record.__name__
+        for record in _flatten(records)
+    ))
+
+
+class CMSCacheExtension(Extension):
+    """
+    Cache rendered template fragments which depend on CMS records::
+
+        {% cmscache 'main-menu', depends=[menu] %}
+            ...
+        {% endcmscache %}
+
+    `depends` lists the records (or lists of records) whose change must
+    refresh the fragment. Fragments are kept in in-memory LRU caches of each
+    worker, one for each model they depend on, which are cleared when
+    records of the model are created, written or deleted (see
+    `SurrogateKeyMixin.queue_purge`). Fragments showing records which are
+    not given, like the articles of a category, list the name of their model
+    in `depends` too::
+
+        {% cmscache 'category', depends=[category, 'nereid.cms.article'] %}
+
+    Fragments depending on nothing are not cached.
+
+    Add it to the jinja environment of the application with::
+
+        app.jinja_env.add_extension(
+            'trytond.modules.nereid_cms.templating.CMSCacheExtension'
+        )
+    """
+    tags = set(['cmscache'])
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        key = parser.parse_expression()
+        depends = nodes.List([])
+        if parser.stream.skip_if('comma'):
+            parser.stream.expect('name:depends')
+            parser.stream.expect('assign')
+            depends = parser.parse_expression()
+
+        body = parser.parse_statements(['name:endcmscache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_support', [key, depends]), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_support(self, name, depends, caller):
+        key = fragment_key(name, depends)
+        caches = [_fragment_cache(model) for model in _fragment_models(depends)]
+        if not caches:
+            return caller()
+        cached = [cache.get(key) for cache in caches]
+        rv = cached[0]
+        if rv is None or any(value is not rv for value in cached):
+            rv = caller()
+            for cache in caches:
+                cache.set(key, rv)
+        return rv
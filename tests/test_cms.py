@@ -5,13 +5,60 @@
 
 
 '''
+import os
+import shutil
+import sqlite3
+import tempfile
 import unittest
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from StringIO import StringIO
+from datetime import date, datetime, timedelta
 
 import trytond.tests.test_tryton
 from trytond.tests.test_tryton import POOL, USER, DB_NAME, CONTEXT, \
     test_view, test_depends
 from nereid.testing import NereidTestCase
+from trytond import backend
 from trytond.transaction import Transaction
+from trytond.exceptions import UserError
+from trytond.config import config
+from trytond.modules.nereid_cms.templating import CMSCacheExtension
+from trytond.modules.nereid_cms.purge import PurgeSink, register_sink
+from trytond.modules.nereid_cms.warmup import _warm_up_records, \
+    _warm_up_shared
+from trytond.modules.nereid_cms.cms import _alias_table
+from trytond.modules.nereid_cms.export import list_pages, _page_file, \
+    article_categories, removed_pages
+from trytond.modules.nereid_cms.renderer import RENDERERS, \
+    register_renderer, renderer_stats
+from trytond.modules.nereid_cms.replica import replica_database, \
+    read_replica, _replicas
+from trytond.modules.nereid_cms.singleflight import single_flight, \
+    discard
+from trytond.modules.nereid_cms.counter import COUNTERS, _flushers
+
+
+class ImageStubHandler(BaseHTTPRequestHandler):
+    """
+    Serve a fake image with an ETag, answering 304 to conditional requests
+    """
+    requests = []
+
+    def do_GET(self):
+        self.requests.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write('fake-png')
+
+    def log_message(self, *args):
+        pass
 
 
 class TestCMS(NereidTestCase):
@@ -33,6 +80,14 @@ class TestCMS(NereidTestCase):
         self.Party = POOL.get('party.party')
         self.Locale = POOL.get('nereid.website.locale')
         self.MenuItem = POOL.get('nereid.cms.menuitem')
+        self.Artifact = POOL.get('nereid.cms.artifact')
+        self.ArtifactJob = POOL.get('nereid.cms.artifact.job')
+        self.Banner = POOL.get('nereid.cms.banner')
+        self.BannerCategory = POOL.get('nereid.cms.banner.category')
+
+        # Counts buffered by a previous test were never flushed
+        for counter in COUNTERS:
+            counter.clear()
 
         self.templates = {
             'home.jinja':
@@ -41,7 +96,18 @@ class TestCMS(NereidTestCase):
             {% endfor %}
             ''',
             'article-category.jinja': '{{ articles|length }}',
+            'article-archive.jinja': '{{ articles|length }}',
+            'article-author.jinja':
+                '{{ articles|length }}|{{ next_page or "" }}',
             'article.jinja': '{{ article.content }}',
+            'cached-article.jinja':
+            '''{% cmscache 'article', depends=[article] %}'''
+            '''{{ article.description }}{% endcmscache %}''',
+            'cached-category.jinja':
+            '''{% cmscache 'category', '''
+            '''depends=[category, 'nereid.cms.article'] %}'''
+            '''{% for article in articles %}{{ article.title }}{% endfor %}'''
+            '''{% endcmscache %}''',
             'test-category.jinja':
             '''{% for article in articles %}
             {{ article.uri }}
@@ -469,6 +535,1212 @@ class TestCMS(NereidTestCase):
                 rv.data.find(article1.uri) > rv.data.find(article2.uri)
             )
 
+    def test_0070_scheduled_transitions(self):
+        """
+        Articles are published and archived by the cron once their scheduled
+        time has passed
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            now = datetime.utcnow()
+
+            due, later = self.Article.create([{
+                'title': 'Due Article',
+                'uri': 'due-article',
+                'content': 'Test Content',
+                'sequence': 10,
+                'publish_at': now - timedelta(minutes=1),
+                'archive_at': now + timedelta(days=1),
+            }, {
+                'title': 'Later Article',
+                'uri': 'later-article',
+                'content': 'Test Content',
+                'sequence': 20,
+                'publish_at': now + timedelta(days=1),
+            }])
+
+            self.Article.run_scheduled_transitions()
+            due, later = self.Article.browse([due.id, later.id])
+            self.assertEqual(due.state, 'published')
+            self.assertEqual(due.publish_at, None)
+            self.assertEqual(later.state, 'draft')
+
+            self.Article.write([due], {
+                'archive_at': now - timedelta(minutes=1),
+            })
+            self.Article.run_scheduled_transitions()
+            due = self.Article(due.id)
+            self.assertEqual(due.state, 'archived')
+            self.assertEqual(due.archive_at, None)
+
+            # Archived articles can not be published, the schedule is kept
+            self.Article.write([due], {
+                'publish_at': now - timedelta(minutes=1),
+            })
+            self.Article.run_scheduled_transitions()
+            due = self.Article(due.id)
+            self.assertEqual(due.state, 'archived')
+            self.assertNotEqual(due.publish_at, None)
+
+    def test_0080_bulk_import_export(self):
+        """
+        Articles exported to JSON lines can be imported back in bulk
+        """
+        ArticleNeighbor = POOL.get('nereid.cms.article.neighbor')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+
+            imported = self.Article.import_file(StringIO(
+                '{"uri": "bulk-1", "title": "Bulk 1", "content": "One", '
+                '"sequence": 5, "categories": ["test-categ"], '
+                '"author": "email@example.com"}\n'
+                '{"uri": "bulk-2", "title": "Bulk 2", "content": "Two", '
+                '"published_on": "2014-01-01", "categories": []}\n'
+            ), batch_size=1)
+            self.assertEqual(imported, 2)
+
+            article, = self.Article.search([('uri', '=', 'bulk-1')])
+            self.assertEqual(article.categories, (self.article_categ,))
+            self.assertEqual(article.author, self.registered_user)
+            self.assertEqual(article.template, 'article.jinja')
+            self.assertEqual(article.state, 'draft')
+
+            output = StringIO()
+            self.Article.export_file(
+                output, domain=[('uri', 'like', 'bulk-%')]
+            )
+            lines = output.getvalue().splitlines()
+            self.assertEqual(len(lines), 2)
+
+            self.Article.delete(self.Article.search([
+                ('uri', 'like', 'bulk-%')
+            ]))
+            self.assertEqual(
+                self.Article.import_file(StringIO(output.getvalue())), 2
+            )
+            article, = self.Article.search([('uri', '=', 'bulk-2')])
+            self.assertEqual(str(article.published_on), '2014-01-01')
+
+            # Imported published articles are counted like created ones
+            test_article, = self.Article.search([
+                ('uri', '=', 'test-article'),
+            ])
+            self.Article.publish([test_article])
+            self.assertEqual(self.Article.import_file(StringIO(
+                '{"uri": "bulk-3", "title": "Bulk 3", "content": "Three", '
+                '"state": "published", "published_on": "2014-02-01", '
+                '"categories": ["test-categ"]}\n'
+            )), 1)
+            self.assertIn(
+                {'year': 2014, 'month': 2, 'count': 1},
+                self.Article.get_article_archive(self.article_categ)
+            )
+            article, = self.Article.search([('uri', '=', 'bulk-3')])
+            self.assertEqual(article.get_related(), [test_article])
+            self.assertEqual(ArticleNeighbor.search_count([
+                ('article', '=', article.id),
+                ('category', '=', self.article_categ.id),
+            ]), 1)
+
+            self.assertRaises(UserError, self.Article.import_file, StringIO(
+                '{"uri": "bulk-4", "title": "Bulk 4", "content": "Four", '
+                '"author": "nobody@example.com"}\n'
+            ))
+
+    def test_0090_related_articles(self):
+        """
+        Related articles are precomputed when articles are published
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            other_categ, = self.ArticleCategory.create([{
+                'title': 'Other Categ',
+                'unique_name': 'other-categ',
+            }])
+            article1, article2, article3 = self.Article.create([{
+                'title': 'Article 1',
+                'uri': 'article-1',
+                'content': 'Test Content',
+                'sequence': 10,
+                'categories': [
+                    ('add', [self.article_categ.id, other_categ.id])
+                ],
+            }, {
+                'title': 'Article 2',
+                'uri': 'article-2',
+                'content': 'Test Content',
+                'sequence': 20,
+                'categories': [
+                    ('add', [self.article_categ.id, other_categ.id])
+                ],
+            }, {
+                'title': 'Article 3',
+                'uri': 'article-3',
+                'content': 'Test Content',
+                'sequence': 30,
+                'categories': [('add', [self.article_categ.id])],
+            }])
+
+            self.Article.publish([article1, article2])
+            self.assertEqual(article1.get_related(), [article2])
+
+            self.Article.publish([article3])
+            self.assertEqual(article1.get_related(), [article2, article3])
+            self.assertEqual(article1.get_related(limit=1), [article2])
+            self.assertEqual(len(article3.get_related()), 2)
+
+            self.Article.archive([article2])
+            self.assertEqual(article1.get_related(), [article3])
+
+    def test_0095_related_articles_limit(self):
+        """
+        Related articles are kept to the limit of every article and follow
+        the categories of published articles
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            self.Article._related_limit = 1
+            self.addCleanup(setattr, self.Article, '_related_limit', 20)
+            other_categ, = self.ArticleCategory.create([{
+                'title': 'Other Categ',
+                'unique_name': 'other-categ',
+            }])
+            article1, article2, article3 = self.Article.create([{
+                'title': 'Article %d' % i,
+                'uri': 'article-%d' % i,
+                'content': 'Test Content',
+                'sequence': i,
+                'categories': [('add', categories)],
+            } for i, categories in [
+                (1, [self.article_categ.id, other_categ.id]),
+                (2, [self.article_categ.id, other_categ.id]),
+                (3, [self.article_categ.id]),
+            ]])
+
+            self.Article.publish([article1, article2])
+            self.Article.publish([article3])
+            self.assertEqual(article1.get_related(), [article2])
+            self.assertEqual(article2.get_related(), [article1])
+            self.assertEqual(len(article3.get_related()), 1)
+
+            self.Article.write([article3], {
+                'categories': [('remove', [self.article_categ.id])],
+            })
+            self.assertEqual(article3.get_related(), [])
+
+    def test_0100_prefetch_translations(self):
+        """
+        Translations prefetched for a list of articles are used on read
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            french, = self.Language.search([('code', '=', 'fr_FR')])
+            self.Language.write([french], {'translatable': True})
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            with Transaction().set_context(language='fr_FR'):
+                self.Article.write([article], {
+                    'title': u'Article de test',
+                })
+
+            with Transaction().set_context(language='fr_FR'):
+                articles = self.Article.search([])
+                self.Article.prefetch_translations(articles)
+
+                # The fields are read without querying the translations
+                cursor = Transaction().cursor
+                execute = cursor.execute
+                queries = []
+
+                def counting_execute(sql, params=None):
+                    if 'ir_translation' in sql:
+                        queries.append(sql)
+                    return execute(sql, params)
+                cursor.execute = counting_execute
+                try:
+                    article = self.Article(article.id)
+                    self.assertEqual(article.title, u'Article de test')
+                    self.assertEqual(article.content, 'Test Content')
+                finally:
+                    del cursor.execute
+                self.assertEqual(queries, [])
+
+            self.assertEqual(self.Article(article.id).title, 'Test Article')
+
+    def test_0110_artifacts(self):
+        """
+        Publishing an article queues the generation of its html, feeds and
+        sitemap, which are then served from the stored artifacts
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.publish([article])
+
+            keys = set(job.key for job in self.ArtifactJob.search([]))
+            self.assertTrue(set([
+                'article-html:%d' % article.id,
+                'article-feed:en_US',
+                'article-sitemap:1:en_US',
+                'article-category-feed:%d:en_US' % self.article_categ.id,
+            ]) <= keys)
+
+            # The cron only runs the jobs which do not need a request
+            self.ArtifactJob.run_pending()
+            self.assertEqual(
+                set(job.key for job in self.ArtifactJob.search([])),
+                keys - set(['article-html:%d' % article.id])
+            )
+            self.assertEqual(
+                self.Artifact.get_content(
+                    'article-html:%d:en_US' % article.id
+                ), 'Test Content'
+            )
+
+            self.ArtifactJob.run_pending(app)
+            self.assertEqual(self.ArtifactJob.search([], count=True), 0)
+
+            # A failing job is kept aside without blocking the others
+            self.ArtifactJob.enqueue([{
+                'key': 'broken', 'model': 'nereid.cms.article',
+                'method': 'generate_html', 'record': -1,
+            }, {
+                'key': 'article-html:%d' % article.id,
+                'model': 'nereid.cms.article', 'method': 'generate_html',
+                'record': article.id,
+            }])
+            self.assertEqual(self.ArtifactJob.run_pending(), 1)
+            broken, = self.ArtifactJob.search([])
+            self.assertEqual(broken.key, 'broken')
+            self.assertEqual(broken.attempts, 1)
+            self.assertTrue(broken.error)
+            self.ArtifactJob.write([broken], {'attempts': 5})
+            self.assertEqual(self.ArtifactJob.run_pending(), 0)
+            self.ArtifactJob.delete([broken])
+
+            with app.test_client() as c:
+                rv = c.get('/article/all.atom')
+                self.assertEqual(rv.status_code, 200)
+                self.assertEqual(rv.data.count('<entry'), 1)
+
+                rv = c.get('/sitemaps/article-1.xml')
+                self.assertEqual(rv.status_code, 200)
+                self.assertIn('/article/test-article', rv.data)
+
+            # A missing artifact is requested from the worker, not built
+            self.Artifact.delete(self.Artifact.search([
+                ('key', 'like', 'article-feed:%'),
+            ]))
+            with app.test_client() as c:
+                rv = c.get('/article/all.atom')
+                self.assertEqual(rv.status_code, 503)
+                self.assertEqual(rv.headers['Retry-After'], '10')
+            self.assertEqual(self.ArtifactJob.search([], count=True), 0)
+            self.ArtifactJob.enqueue_requested()
+            job, = self.ArtifactJob.search([])
+            self.assertEqual(job.key, 'article-feed:en_US')
+            self.ArtifactJob.run_pending(app)
+
+            # Drafts are not generated again when they are edited
+            draft, = self.Article.create([{
+                'title': 'Draft',
+                'uri': 'draft',
+                'content': 'Draft Content',
+                'sequence': 30,
+            }])
+            self.Article.write([draft], {'content': 'New Draft Content'})
+            self.assertEqual(self.ArtifactJob.search([], count=True), 0)
+
+            # Editing the content drops the stale html immediately
+            self.Article.write([article], {'content': 'New Content'})
+            self.assertEqual(
+                self.Artifact.get_content(
+                    'article-html:%d:en_US' % article.id
+                ), None
+            )
+            self.assertEqual(
+                self.Article(article.id).__html__(), 'New Content'
+            )
+
+    def test_0120_uri_lookup(self):
+        """
+        Published articles are found by their uri in every language
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            french, = self.Language.search([('code', '=', 'fr_FR')])
+            self.Language.write([french], {'translatable': True})
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.assertEqual(
+                self.Article.get_id_from_uri('test-article'), None
+            )
+            # Misses are not cached
+            self.assertEqual(
+                self.Article._uri_cache.get(('en_US', 'test-article'), -1), -1
+            )
+
+            self.Article.publish([article])
+            self.assertEqual(
+                self.Article.get_id_from_uri('test-article'), article.id
+            )
+
+            with Transaction().set_context(language='fr_FR'):
+                self.Article.write([article], {'uri': 'article-de-test'})
+                self.assertEqual(
+                    self.Article.get_id_from_uri('article-de-test'),
+                    article.id
+                )
+            self.assertEqual(
+                self.Article.get_id_from_uri('article-de-test'), None
+            )
+
+            self.Article.draft([article])
+            self.assertEqual(
+                self.Article.get_id_from_uri('test-article'), None
+            )
+
+            # A published uri can not be published by another article
+            self.Article.publish([article])
+            self.assertRaises(UserError, self.Article.create, [{
+                'title': 'Twin Article',
+                'uri': 'test-article',
+                'content': 'Test Content',
+                'state': 'published',
+            }])
+
+    def test_0140_fragment_cache(self):
+        """
+        Fragments cached with cmscache are rendered again once a record they
+        depend on is written
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+            app.jinja_env.add_extension(CMSCacheExtension)
+
+            article, = self.Article.create([{
+                'title': 'Cached Article',
+                'uri': 'cached-article',
+                'content': 'Test Content',
+                'description': 'First',
+                'template': 'cached-article.jinja',
+                'sequence': 10,
+                'state': 'published',
+            }])
+
+            with app.test_client() as c:
+                self.assertEqual(c.get('/article/cached-article').data, 'First')
+
+            # Changes bypassing the ORM are not seen: the fragment is cached
+            article_table = self.Article.__table__()
+            Transaction().cursor.execute(*article_table.update(
+                columns=[article_table.description], values=['Second'],
+                where=article_table.id == article.id
+            ))
+            with app.test_client() as c:
+                self.assertEqual(c.get('/article/cached-article').data, 'First')
+
+            self.Article.write([article], {'description': 'Third'})
+            with app.test_client() as c:
+                self.assertEqual(c.get('/article/cached-article').data, 'Third')
+
+            # Fragments are dropped when records of a model they list change
+            self.ArticleCategory.write([self.article_categ], {
+                'template': 'cached-category.jinja',
+            })
+            self.Article.write([article], {'categories': [
+                ('add', [self.article_categ.id]),
+            ]})
+            with app.test_client() as c:
+                self.assertEqual(
+                    c.get('/article-category/test-categ/').data,
+                    'Cached Article'
+                )
+            self.Article.write([article], {'title': 'Renamed Article'})
+            with app.test_client() as c:
+                self.assertEqual(
+                    c.get('/article-category/test-categ/').data,
+                    'Renamed Article'
+                )
+
+    def test_0150_surrogate_keys(self):
+        """
+        Responses carry the surrogate keys of their records, and writing the
+        records sends the purge of those keys to the sink in one batch
+        """
+        Purge = POOL.get('nereid.cms.purge')
+        purged = []
+
+        class RecordingSink(PurgeSink):
+            def purge(self, keys):
+                purged.append(keys)
+
+        register_sink('test', RecordingSink)
+        if not config.has_section('nereid_cms'):
+            config.add_section('nereid_cms')
+        config.set('nereid_cms', 'purge_sink', 'test')
+        self.addCleanup(config.remove_option, 'nereid_cms', 'purge_sink')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.publish([article])
+            Purge.flush()
+            del purged[:]
+
+            with app.test_client() as c:
+                rv = c.get('/article/test-article')
+                self.assertEqual(rv.status_code, 200)
+                self.assertEqual(
+                    rv.headers['Surrogate-Key'],
+                    'nereid-cms-article-%d' % article.id
+                )
+
+                rv = c.get('/article-category/test-categ/')
+                self.assertEqual(rv.status_code, 200)
+                self.assertIn(
+                    'nereid-cms-article-%d' % article.id,
+                    rv.headers['Surrogate-Key'].split()
+                )
+                self.assertIn(
+                    'nereid-cms-article-category-%d' % self.article_categ.id,
+                    rv.headers['Cache-Tag'].split(',')
+                )
+
+            self.Article.write([article], {'title': 'New Title'})
+            self.Article.write([article], {'content': 'New Content'})
+            # As queued by a concurrent transaction
+            Purge.create([{'key': 'nereid-cms-article-list'}])
+            Purge.flush()
+            self.assertEqual(purged, [sorted([
+                'nereid-cms-article-%d' % article.id,
+                'nereid-cms-article-list',
+                'nereid-cms-article-category-%d' % self.article_categ.id,
+            ])])
+            self.assertEqual(Purge.search([], count=True), 0)
+
+    def test_0160_preload_links(self):
+        """
+        Images of the banner of an article are announced in Link headers
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            banner_category, = self.BannerCategory.create([{
+                'name': 'article-banners',
+            }])
+            banner, = self.Banner.create([{
+                'name': 'Hero',
+                'type': 'remote_image',
+                'remote_image_url': 'http://example.com/hero.png',
+                'category': banner_category.id,
+            }])
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.write([article], {'banner': banner.id})
+            self.Article.publish([article])
+
+            with app.test_client() as c:
+                rv = c.get('/article/test-article')
+                self.assertEqual(rv.status_code, 200)
+                self.assertEqual(
+                    rv.headers.getlist('Link'),
+                    ['<http://example.com/hero.png>; rel=preload; as=image']
+                )
+
+    def test_0170_warm_up(self):
+        """
+        Warming up fills the translation, uri and banner sampler caches and
+        generates the missing html of the recent articles
+        """
+        Translation = POOL.get('ir.translation')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.publish([article])
+            banner_category, = self.BannerCategory.create([{
+                'name': 'warm-banners',
+            }])
+            banner, = self.Banner.create([{
+                'name': 'Warm',
+                'type': 'custom_code',
+                'custom_code': 'Warm banner',
+                'category': banner_category.id,
+            }])
+            self.Banner.publish([banner])
+            key = self.Article(article.id)._html_artifact_key()
+            self.assertEqual(self.Artifact.get_content(key), None)
+
+            _warm_up_records(POOL, 10)
+            _warm_up_shared(POOL, None)
+            self.assertEqual(self.Artifact.get_content(key), 'Test Content')
+            self.assertEqual(
+                self.Article._uri_cache.get(('en_US', 'test-article')),
+                article.id
+            )
+            self.assertEqual(
+                self.BannerCategory._sampler_cache.get(
+                    banner_category.id
+                )[0],
+                [banner.id]
+            )
+            self.assertIsNotNone(Translation._translation_cache.get(
+                ('en_US', 'model', 'nereid.cms.article,title', article.id)
+            ))
+
+    def test_0180_content_renderers(self):
+        """
+        Formats registered in the renderer registry are selectable and
+        rendered without changing the article model
+        """
+        register_renderer('upper', 'Upper Case', 'string:upper')
+        self.addCleanup(RENDERERS.pop, 'upper')
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.assertIn(
+                ('upper', 'Upper Case'),
+                self.Article.content_type_selection()
+            )
+            article = self.Article(content='shout', content_type='upper')
+            self.assertEqual(article.render_content(), 'SHOUT')
+            self.assertEqual(renderer_stats()['upper']['calls'], 1)
+
+    def test_0190_article_archive(self):
+        """
+        Monthly counts of published articles follow the transitions
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            articles = self.Article.create([{
+                'title': 'Archived Article %d' % i,
+                'uri': 'archived-article-%d' % i,
+                'content': 'Test Content',
+                'sequence': i,
+                'published_on': published_on,
+                'categories': [('add', [self.article_categ.id])],
+            } for i, published_on in enumerate([
+                date(2015, 1, 10), date(2015, 1, 31), date(2015, 2, 1),
+            ])])
+            self.assertEqual(self.Article.get_article_archive(), [])
+
+            self.Article.publish(articles)
+            self.assertEqual(self.Article.get_article_archive(), [
+                {'year': 2015, 'month': 2, 'count': 1},
+                {'year': 2015, 'month': 1, 'count': 2},
+            ])
+            self.assertEqual(
+                self.Article.get_article_archive(self.article_categ),
+                self.Article.get_article_archive()
+            )
+
+            self.Article.draft(articles[:1])
+            self.Article.write(articles[1:2], {
+                'published_on': date(2015, 2, 2),
+            })
+            self.assertEqual(self.Article.get_article_archive(), [
+                {'year': 2015, 'month': 2, 'count': 2},
+            ])
+
+            with app.test_client() as c:
+                rv = c.get('/article/archive/2015/2')
+                self.assertEqual(rv.data, '2')
+                rv = c.get('/article/archive/2015/1')
+                self.assertEqual(rv.data, '0')
+                rv = c.get('/article/archive/2015/13')
+                self.assertEqual(rv.status_code, 404)
+                rv = c.get('/article/archive/0/1')
+                self.assertEqual(rv.status_code, 404)
+                rv = c.get('/article/archive/9999/12')
+                self.assertEqual(rv.status_code, 404)
+                rv = c.get('/article/archive/10000/1')
+                self.assertEqual(rv.status_code, 404)
+
+    def test_0200_popular_articles(self):
+        """
+        Article views are buffered by the worker and ranked from the daily
+        counts
+        """
+        ArticleView = POOL.get('nereid.cms.article.view')
+        ArticlePopular = POOL.get('nereid.cms.article.popular')
+
+        if not config.has_section('nereid_cms'):
+            config.add_section('nereid_cms')
+        config.set('nereid_cms', 'counter_flush_interval', '3600')
+        self.addCleanup(
+            config.remove_option, 'nereid_cms', 'counter_flush_interval'
+        )
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            other, = self.Article.create([{
+                'title': 'Other Article',
+                'uri': 'other-article',
+                'content': 'Test Content',
+                'sequence': 20,
+            }])
+            self.Article.publish([article, other])
+            today = datetime.utcnow().date()
+
+            with app.test_client() as c:
+                c.get('/article/test-article')
+            self.assertEqual(
+                self.Article._view_counter.pending()[(article.id, today)], 1
+            )
+            # Counting starts the flusher of the worker
+            self.assertIn(
+                (os.getpid(), Transaction().cursor.database_name), _flushers
+            )
+
+            ArticleView.add_counts({(article.id, today): 2})
+            ArticleView.add_counts({
+                (article.id, today): 1,
+                (other.id, today): 5,
+                (article.id, today - timedelta(days=3)): 4,
+            })
+            self.assertEqual(ArticleView.search([], count=True), 3)
+
+            ArticlePopular.refresh()
+            self.assertEqual(
+                self.Article.get_popular_articles(period='day'),
+                [other, article]
+            )
+            self.assertEqual(
+                self.Article.get_popular_articles(period='week', limit=1),
+                [article]
+            )
+            self.assertEqual(
+                self.Article.get_popular_articles(self.article_categ, 'day'),
+                [article]
+            )
+
+    def test_0210_banner_tracking(self):
+        """
+        Impressions and clicks of tracked banners are counted in memory and
+        flushed in one insert
+        """
+        BannerStat = POOL.get('nereid.cms.banner.stat')
+
+        if not config.has_section('nereid_cms'):
+            config.add_section('nereid_cms')
+        config.set('nereid_cms', 'counter_flush_interval', '3600')
+        self.addCleanup(
+            config.remove_option, 'nereid_cms', 'counter_flush_interval'
+        )
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            banner_category, = self.BannerCategory.create([{
+                'name': 'tracked-banners',
+            }])
+            banner, = self.Banner.create([{
+                'name': 'Tracked',
+                'type': 'remote_image',
+                'remote_image_url': 'http://example.com/banner.png',
+                'click_url': 'http://example.com/offer',
+                'category': banner_category.id,
+                'tracking': True,
+            }])
+            self.Banner.publish([banner])
+
+            with app.test_request_context('/'):
+                html = self.Banner(banner.id).get_html()
+                self.assertIn('/banner/%d/click' % banner.id, html)
+                self.Banner(banner.id).get_html()
+            with app.test_client() as c:
+                rv = c.get('/banner/%d/click' % banner.id)
+                self.assertEqual(rv.status_code, 302)
+                self.assertEqual(rv.location, 'http://example.com/offer')
+
+            self.assertEqual(BannerStat.search([], count=True), 0)
+            banner = self.Banner(banner.id)
+            self.assertEqual((banner.impressions, banner.clicks), (2, 1))
+
+            today = datetime.utcnow().date()
+            counts = self.Banner._tracking_counter.pending()
+            BannerStat.add_counts(counts)
+            self.assertEqual(BannerStat.search([], count=True), 1)
+            stat, = BannerStat.search([])
+            self.assertEqual(
+                (stat.banner, stat.bucket, stat.impressions, stat.clicks),
+                (banner, today, 2, 1)
+            )
+
+            # Later flushes are added to the row of the day
+            BannerStat.add_counts({(banner.id, today, 'clicks'): 3})
+            stat, = BannerStat.search([])
+            self.assertEqual((stat.impressions, stat.clicks), (2, 4))
+
+            # Clicks on banners which are no longer published are not counted
+            self.Banner.archive([banner])
+            with app.test_client() as c:
+                rv = c.get('/banner/%d/click' % banner.id)
+                self.assertEqual(rv.status_code, 404)
+
+    def test_0220_banner_rotation(self):
+        """
+        Banners are picked in proportion to their weights
+        """
+        weights = [1, 3, 0, 4]
+        probabilities, aliases = _alias_table(weights)
+        for index, weight in enumerate(weights):
+            share = probabilities[index] + sum(
+                1 - probabilities[other]
+                for other, alias in enumerate(aliases)
+                if alias == index and other != index
+            )
+            self.assertAlmostEqual(share / len(weights), weight / 8.0)
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            category, = self.BannerCategory.create([{
+                'name': 'rotation',
+            }])
+            banners = self.Banner.create([{
+                'name': 'Banner %d' % weight,
+                'type': 'remote_image',
+                'remote_image_url': 'http://example.com/%d.png' % weight,
+                'category': category.id,
+                'weight': weight,
+            } for weight in [1, 0, 3]])
+            self.assertEqual(category.pick_banners(2), [])
+
+            self.Banner.publish(banners)
+            for _ in range(20):
+                picked = category.pick_banners(2)
+                self.assertEqual(len(set(picked)), 2)
+                self.assertNotIn(banners[1], picked)
+            self.assertEqual(
+                set(category.pick_banners(5)), set([banners[0], banners[2]])
+            )
+
+            # A dominant weight does not slow down the draws of the others
+            others = self.Banner.create([{
+                'name': 'Banner %d' % weight,
+                'type': 'remote_image',
+                'remote_image_url': 'http://example.com/%d.png' % weight,
+                'category': category.id,
+                'weight': weight,
+            } for weight in [10 ** 9, 1]])
+            self.Banner.publish(others)
+            picked = category.pick_banners(3)
+            self.assertEqual(len(set(picked)), 3)
+            self.assertIn(others[0], picked)
+            self.assertEqual(len(category.pick_banners()), 1)
+
+            # Only the fields the samplers are built from drop them
+            self.Banner.write([others[1]], {'name': 'Renamed'})
+            self.assertIsNotNone(
+                self.BannerCategory._sampler_cache.get(category.id)
+            )
+            self.Banner.write([others[1]], {'weight': 2})
+            self.assertIsNone(
+                self.BannerCategory._sampler_cache.get(category.id)
+            )
+
+    def test_0230_cached_remote_image(self):
+        """
+        Remote banner images are copied locally in the background and only
+        downloaded again when they changed
+        """
+        server = HTTPServer(('127.0.0.1', 0), ImageStubHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.shutdown)
+        del ImageStubHandler.requests[:]
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            folder, = self.Folder.create([{
+                'name': 'cms',
+                'description': 'CMS',
+            }])
+            website, = self.Website.search([])
+            self.Website.write([website], {'cms_static_folder': folder.id})
+            banner_category, = self.BannerCategory.create([{
+                'name': 'cached-banners',
+                'website': website.id,
+            }])
+            banner, = self.Banner.create([{
+                'name': 'Remote',
+                'type': 'remote_image',
+                'remote_image_url':
+                'http://127.0.0.1:%d/remote.png' % server.server_port,
+                'cache_remote_image': True,
+                'category': banner_category.id,
+            }])
+            self.assertEqual(self.ArtifactJob.search([], count=True), 0)
+
+            self.Banner.publish([banner])
+            self.ArtifactJob.run_pending()
+            banner = self.Banner(banner.id)
+            self.assertEqual(
+                banner.cached_image.name, 'banner-%d.png' % banner.id
+            )
+            self.assertEqual(str(banner.cached_image.file_binary), 'fake-png')
+            self.assertEqual(banner.cached_image_etag, '"v1"')
+
+            with app.test_request_context('/'):
+                self.assertIn(
+                    '/static-file/cms/banner-%d.png' % banner.id,
+                    banner.get_html()
+                )
+
+            self.Banner.refresh_cached_images()
+            self.ArtifactJob.run_pending()
+            self.assertEqual(ImageStubHandler.requests, [None, '"v1"'])
+            self.assertEqual(
+                self.Banner(banner.id).cached_image, banner.cached_image
+            )
+
+            # Saving the same url keeps the copy
+            self.Banner.write([banner], {
+                'remote_image_url': banner.remote_image_url,
+            })
+            self.assertEqual(
+                self.Banner(banner.id).cached_image, banner.cached_image
+            )
+
+            # A new remote image is downloaded unconditionally and the copy
+            # of the previous one is not served meanwhile
+            new_url = 'http://127.0.0.1:%d/new.png' % server.server_port
+            self.Banner.write([banner], {'remote_image_url': new_url})
+            banner = self.Banner(banner.id)
+            self.assertEqual(banner.cached_image, None)
+            self.assertEqual(banner.cached_image_etag, None)
+            self.assertEqual(banner.get_image_url(), new_url)
+            self.ArtifactJob.run_pending()
+            self.assertEqual(ImageStubHandler.requests, [None, '"v1"', None])
+            self.assertEqual(
+                str(self.Banner(banner.id).cached_image.file_binary),
+                'fake-png'
+            )
+
+    def test_0240_static_export_pages(self):
+        """
+        The static export lists the pages of the published content, and only
+        the changed ones and the ones of the categories which lost articles
+        in incremental mode
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.publish([article])
+
+            with app.test_request_context('/'):
+                paths = list_pages()
+                self.assertIn('/article/test-article', paths)
+                self.assertIn('/article-category/test-categ/', paths)
+                self.assertIn('/article/all.atom', paths)
+                self.assertIn('/sitemaps/article-1.xml', paths)
+
+                paths = list_pages(datetime.utcnow() + timedelta(days=1))
+                self.assertNotIn('/article/test-article', paths)
+                self.assertNotIn('/article-category/test-categ/', paths)
+                self.assertIn('/article/all.atom', paths)
+
+                previous = {
+                    'pages': list_pages(),
+                    'articles': article_categories(),
+                }
+                self.assertEqual(
+                    previous['articles'],
+                    {'/article/test-article': ['test-categ']}
+                )
+
+            # The page of an unpublished article is removed and its
+            # categories are rendered again
+            self.Article.draft([article])
+            with app.test_request_context('/'):
+                articles = article_categories()
+                removed, categories = removed_pages(
+                    previous, list_pages(), articles
+                )
+                self.assertEqual(removed, set(['/article/test-article']))
+                self.assertEqual(categories, set(['test-categ']))
+                paths = list_pages(
+                    datetime.utcnow() + timedelta(days=1), categories
+                )
+                self.assertIn('/article-category/test-categ/', paths)
+
+        self.assertEqual(
+            _page_file('/out', 'localhost', '/article/test-article'),
+            '/out/localhost/article/test-article/index.html'
+        )
+        self.assertEqual(
+            _page_file('/out', 'localhost', '/article/all.atom'),
+            '/out/localhost/article/all.atom'
+        )
+
+    @unittest.skipUnless(
+        backend.name() == 'sqlite', 'The replica stand-in is an SQLite file'
+    )
+    def test_0250_read_replica(self):
+        """
+        Read only routes read from the replica when one is configured
+        """
+        replica_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, replica_path)
+        replica = sqlite3.connect(
+            os.path.join(replica_path, 'replica-test.sqlite')
+        )
+        replica.execute('CREATE TABLE marker (name VARCHAR)')
+        replica.execute("INSERT INTO marker VALUES ('replica')")
+        replica.commit()
+        replica.close()
+
+        @read_replica
+        def database_name():
+            return Transaction().cursor.database_name
+
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+
+            # Without a replica the routes use the cursor of the request
+            self.assertIsNone(replica_database(DB_NAME))
+            self.assertEqual(database_name(), DB_NAME)
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.Article.publish([article])
+            with app.test_client() as c:
+                rv = c.get('/article/test-article')
+                self.assertEqual(rv.status_code, 200)
+
+        if not config.has_section('nereid_cms'):
+            config.add_section('nereid_cms')
+        config.set('nereid_cms', 'replica_path', replica_path)
+        self.addCleanup(config.remove_option, 'nereid_cms', 'replica_path')
+        self.addCleanup(_replicas.pop, 'replica-test', None)
+
+        database = replica_database('replica-test')
+        self.assertIs(database, replica_database('replica-test'))
+        self.assertEqual(database.database_name, 'replica-test')
+        cursor = database.cursor(readonly=True)
+        try:
+            cursor.execute('SELECT name FROM marker')
+            self.assertEqual(cursor.fetchone(), ('replica', ))
+        finally:
+            cursor.close()
+        # The primary database configuration is left untouched
+        self.assertNotEqual(config.get('database', 'path'), replica_path)
+
+    def test_0260_article_neighbors(self):
+        """
+        The previous and next articles follow the listing order of the
+        category as articles are published, moved, written and removed
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            self.ArticleCategory.write(
+                [self.article_categ], {'sort_order': 'sequence'}
+            )
+
+            article, = self.Article.search([('uri', '=', 'test-article')])
+            self.assertEqual(
+                article.get_neighbors(self.article_categ), (None, None)
+            )
+            self.Article.publish([article])
+            article1, article2 = self.Article.create([{
+                'title': 'Test Article 1',
+                'uri': 'test-article1',
+                'content': 'Test Content',
+                'sequence': 30,
+                'categories': [('add', [self.article_categ.id])],
+                'state': 'published',
+            }, {
+                'title': 'Test Article 2',
+                'uri': 'test-article2',
+                'content': 'Test Content',
+                'sequence': 20,
+                'categories': [('add', [self.article_categ.id])],
+                'state': 'published',
+            }])
+            self.assertEqual(
+                article.get_neighbors(self.article_categ), (None, article2)
+            )
+            self.assertEqual(
+                article2.get_neighbors(self.article_categ), (article, article1)
+            )
+            self.assertEqual(
+                article1.get_neighbors(self.article_categ), (article2, None)
+            )
+
+            self.Article.write([article1], {'sequence': 5})
+            self.Article.draft([article2])
+            self.assertEqual(
+                article.get_neighbors(self.article_categ), (article1, None)
+            )
+            self.assertEqual(
+                article2.get_neighbors(self.article_categ), (None, None)
+            )
+
+            self.Article.delete([article1])
+            self.assertEqual(
+                article.get_neighbors(self.article_categ), (None, None)
+            )
+
+            # Written articles go to the head of the listings ordered by
+            # recent first without ranking them again
+            ArticleNeighbor = POOL.get('nereid.cms.article.neighbor')
+            recent, = self.ArticleCategory.create([{
+                'title': 'Recent',
+                'unique_name': 'recent',
+                'sort_order': 'recent_first',
+            }])
+            first, second, third = self.Article.create([{
+                'title': 'Recent Article %d' % i,
+                'uri': 'recent-article-%d' % i,
+                'content': 'Test Content',
+                'categories': [('add', [recent.id])],
+            } for i in range(3)])
+            for record in (first, second, third):
+                self.Article.publish([record])
+            self.assertEqual(first.get_neighbors(recent), (second, None))
+            neighbors = ArticleNeighbor.search([('category', '=', recent.id)])
+
+            self.Article.write([first], {'title': 'Recent Article'})
+            self.assertEqual(first.get_neighbors(recent), (None, third))
+            self.assertEqual(third.get_neighbors(recent), (first, second))
+            self.assertEqual(second.get_neighbors(recent), (third, None))
+            self.Article.write([first], {'title': 'Recent Article 0'})
+            self.assertEqual(first.get_neighbors(recent), (None, third))
+            self.assertEqual(
+                ArticleNeighbor.search([('category', '=', recent.id)]),
+                neighbors
+            )
+
+    def test_0270_author_articles(self):
+        """
+        The author page lists the published articles a page at a time and
+        the published article count of the author follows the transitions
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            self.setup_defaults()
+            app = self.get_app()
+            self.NereidUser._articles_per_page = 2
+            self.addCleanup(
+                setattr, self.NereidUser, '_articles_per_page', 10
+            )
+
+            articles = self.Article.create([{
+                'title': 'Author Article %d' % i,
+                'uri': 'author-article-%d' % i,
+                'content': 'Test Content',
+                'sequence': i,
+                'published_on': published_on,
+                'author': self.registered_user.id,
+            } for i, published_on in enumerate([
+                date(2015, 1, 10), date(2015, 1, 10), date(2015, 2, 1),
+            ])])
+            self.assertEqual(
+                self.NereidUser(self.registered_user.id).article_count, 0
+            )
+
+            self.Article.publish(articles)
+            self.assertEqual(
+                self.NereidUser(self.registered_user.id).article_count, 3
+            )
+
+            url = '/article-author/%d/' % self.registered_user.id
+            with app.test_client() as c:
+                rv = c.get(url)
+                self.assertEqual(
+                    rv.data, '2|%s2015-01-10.%d' % (url, articles[1].id)
+                )
+                rv = c.get('%s2015-01-10.%d' % (url, articles[1].id))
+                self.assertEqual(rv.data, '1|')
+                rv = c.get(url + 'last-page')
+                self.assertEqual(rv.status_code, 404)
+
+            self.Article.draft(articles[:1])
+            self.Article.write(articles[1:2], {'author': None})
+            self.assertEqual(
+                self.NereidUser(self.registered_user.id).article_count, 1
+            )
+            self.Article.delete(articles[2:])
+            self.assertEqual(
+                self.NereidUser(self.registered_user.id).article_count, 0
+            )
+
+    def test_0280_single_flight(self):
+        """
+        A document is built once by concurrent workers, which are given the
+        previous copy while it is built again, until the copy is discarded
+        """
+        lock_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_path)
+        if not config.has_section('nereid_cms'):
+            config.add_section('nereid_cms')
+        config.set('nereid_cms', 'lock_path', lock_path)
+        self.addCleanup(config.remove_option, 'nereid_cms', 'lock_path')
+        config.set('nereid_cms', 'single_flight_ttl', '0')
+        self.addCleanup(
+            config.remove_option, 'nereid_cms', 'single_flight_ttl'
+        )
+
+        builds, results = [], []
+        started, release = threading.Event(), threading.Event()
+
+        def build():
+            builds.append(None)
+            started.set()
+            release.wait()
+            return u'feed %d' % len(builds)
+
+        def request():
+            results.append(single_flight('article-feed', build))
+
+        # Without a previous copy the builder is waited for
+        builder = threading.Thread(target=request)
+        builder.start()
+        started.wait()
+        threading.Timer(0.2, release.set).start()
+        self.assertEqual(single_flight('article-feed', build), u'feed 1')
+        builder.join()
+        self.assertEqual(results, [u'feed 1'])
+        self.assertEqual(len(builds), 1)
+
+        # Then the previous copy is served while it is built again
+        started.clear()
+        release.clear()
+        builder = threading.Thread(target=request)
+        builder.start()
+        started.wait()
+        self.assertEqual(single_flight('article-feed', build), u'feed 1')
+        release.set()
+        builder.join()
+        self.assertEqual(results, [u'feed 1', u'feed 2'])
+
+        # A fresh copy is not built again
+        config.set('nereid_cms', 'single_flight_ttl', '60')
+        self.assertEqual(
+            single_flight('article-feed', lambda: u'feed 3'), u'feed 2'
+        )
+
+        # Until it is discarded along with its lock file
+        discard('article-feed')
+        self.assertEqual(os.listdir(lock_path), [])
+        self.assertEqual(
+            single_flight('article-feed', lambda: u'feed 3'), u'feed 3'
+        )
+
 
 def suite():
     "CMS test suite"
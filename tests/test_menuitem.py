@@ -5,6 +5,8 @@
 
 
 '''
+import json
+import pickle
 import unittest
 
 import trytond.tests.test_tryton
@@ -142,6 +144,61 @@ class TestMenuItem(NereidTestCase):
                 if child['type_'] == 'record' and child['record'] == category:
                     self.assertEqual(len(child['children']), 1)
 
+    def test_0020_menu_node(self):
+        """
+        Menu nodes are picklable read only mappings which load their record
+        when accessed
+        """
+        with Transaction().start(DB_NAME, USER, CONTEXT):
+            category, = self.ArticleCategory.create([{
+                'title': 'blog',
+                'unique_name': 'blog',
+            }])
+            main_view, = self.MenuItem.create([{
+                'type_': 'view',
+                'title': 'Main',
+            }])
+            self.MenuItem.create([{
+                'type_': 'record',
+                'title': 'Blog',
+                'record': '%s,%s' % (category.__name__, category.id),
+                'parent': main_view,
+            }])
+
+            self.setup_defaults()
+            app = self.get_app()
+            with app.test_request_context('/'):
+                node = main_view.get_menu_item(max_depth=10)
+
+            node = pickle.loads(pickle.dumps(node))
+            self.assertEqual(node['title'], 'Main')
+            self.assertNotIn('record', node)
+            self.assertEqual(node.get('link'), None)
+            child, = node['children']
+            self.assertEqual(child.title, 'Blog')
+            self.assertEqual(child['record'], category)
+            self.assertEqual(
+                child.link, '/article-category/blog/'
+            )
+            self.assertRaises(AttributeError, setattr, child, 'title', 'X')
+            self.assertRaises(TypeError, child.__setitem__, 'title', 'X')
+
+            # Nodes are mappings, serialized with the reference of the record
+            self.assertEqual(
+                sorted(node), ['children', 'target', 'title', 'type_']
+            )
+            self.assertEqual(len(child), 6)
+            self.assertEqual(
+                json.loads(json.dumps(node, sort_keys=True))['children'], [{
+                    'title': 'Blog',
+                    'link': '/article-category/blog/',
+                    'target': '_self',
+                    'type_': 'record',
+                    'children': [],
+                    'record': '%s,%s' % (category.__name__, category.id),
+                }]
+            )
+
 
 def suite():
     suite = unittest.TestSuite()
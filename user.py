@@ -6,11 +6,24 @@
 
 
 '''
+from datetime import datetime
+
+from sql import Null
+from sql.aggregate import Count
+
+from trytond import backend
+from trytond.model import fields
 from trytond.pool import Pool, PoolMeta
+from trytond.transaction import Transaction
 
-from nereid import route, request, abort
+from nereid import route, request, abort, render_template
+from nereid.helpers import url_for
 from werkzeug.contrib.atom import AtomFeed
 
+from .cms import _chunks, _request_artifact_key
+from .purge import surrogate_response
+from .replica import read_replica
+
 __all__ = ['NereidUser']
 __metaclass__ = PoolMeta
 
@@ -18,6 +31,67 @@ __metaclass__ = PoolMeta
 class NereidUser:
     __name__ = 'nereid.user'
 
+    article_count = fields.Integer('Published Articles', readonly=True)
+
+    #: Number of articles listed on a page of the author
+    _articles_per_page = 10
+
+    @staticmethod
+    def default_article_count():
+        return 0
+
+    @classmethod
+    def __register__(cls, module_name):
+        TableHandler = backend.get('TableHandler')
+        cursor = Transaction().cursor
+
+        table = TableHandler(cursor, cls, module_name)
+        counted = table.column_exist('article_count')
+
+        super(NereidUser, cls).__register__(module_name)
+
+        # Count the articles published before the count was maintained
+        if not counted:
+            table = cls.__table__()
+            cursor.execute(*table.select(table.id))
+            cls.refresh_article_counts([id_ for id_, in cursor.fetchall()])
+
+    @classmethod
+    def refresh_article_counts(cls, users):
+        """
+        Count again the articles published by the given users (or ids), with
+        one grouped query per batch of users, so that author listings show
+        the counts without aggregating the articles
+        """
+        Article = Pool().get('nereid.cms.article')
+        cursor = Transaction().cursor
+        table = cls.__table__()
+        article = Article.__table__()
+
+        counts = dict.fromkeys(map(int, users), 0)
+        for sub_ids in _chunks(counts.keys(), cursor.IN_MAX):
+            cursor.execute(*article.select(
+                article.author, Count(article.id),
+                where=article.author.in_(sub_ids) &
+                (article.state == 'published') &
+                (article.published_on != Null),
+                group_by=[article.author]
+            ))
+            counts.update(cursor.fetchall())
+        for user_id, count in counts.iteritems():
+            cursor.execute(*table.update(
+                columns=[table.article_count], values=[count],
+                where=table.id == user_id
+            ))
+
+        # The counts are not written by the ORM, so the records read before
+        # are dropped from the cursor cache as `write` does
+        for cache in cursor.cache.itervalues():
+            if cls.__name__ in cache:
+                for user_id in counts:
+                    if user_id in cache[cls.__name__]:
+                        cache[cls.__name__][user_id].clear()
+
     def serialize(self, purpose=None):
         """
         Downstream implementation of serialize() which adds serialization for
@@ -32,26 +106,138 @@ class NereidUser:
             return super(NereidUser, self).serialize(purpose=purpose)
 
     @classmethod
-    @route('/article-author/<int:id>.atom')
+    @route('/article-author/<int:id>.atom', readonly=True)
+    @read_replica
     def atom_feed(cls, id):
         """
         Returns the atom feed for all articles published under a certain author
         """
+        pool = Pool()
+        Artifact = pool.get('nereid.cms.artifact')
+        Article = pool.get('nereid.cms.article')
+
+        try:
+            user, = cls.search([('id', '=', id)])
+        except ValueError:
+            abort(404)
+
+        content = Artifact.get_or_queue(
+            user._feed_artifact_key(), user._feed_job()
+        )
+        return surrogate_response(
+            content, [Article.list_surrogate_key()],
+            mimetype='application/atom+xml'
+        )
+
+    @classmethod
+    @route('/article-author/<int:id>/', readonly=True)
+    @route('/article-author/<int:id>/<after>', readonly=True)
+    @read_replica
+    def render_articles(cls, id, after=None):
+        """
+        Renders the articles published by the user, most recent first.
+
+        Pages are keyed by the last article of the previous page, as
+        `<published on>.<id>` (`after`), so that any page is read from the
+        (author, state, published_on) index without counting the articles
+        before it.
+        """
         Article = Pool().get('nereid.cms.article')
 
         try:
-            articles = Article.search([
-                ('author', '=', id),
-                ('state', '=', 'published'),
-            ])
-        except:
+            user, = cls.search([('id', '=', id)])
+        except ValueError:
             abort(404)
 
+        domain = [
+            ('author', '=', user.id),
+            ('state', '=', 'published'),
+            ('published_on', '!=', None),
+        ]
+        if after is not None:
+            try:
+                published_on, article_id = after.split('.')
+                published_on = datetime.strptime(
+                    published_on, '%Y-%m-%d'
+                ).date()
+                article_id = int(article_id)
+            except ValueError:
+                abort(404)
+            domain.append([
+                'OR',
+                ('published_on', '<', published_on),
+                [
+                    ('published_on', '=', published_on),
+                    ('id', '<', article_id),
+                ],
+            ])
+        articles = Article.search(
+            domain, limit=cls._articles_per_page + 1,
+            order=[('published_on', 'DESC'), ('id', 'DESC')]
+        )
+
+        next_page = None
+        if len(articles) > cls._articles_per_page:
+            articles = articles[:cls._articles_per_page]
+            last = articles[-1]
+            next_page = url_for(
+                'nereid.user.render_articles', id=user.id,
+                after='%s.%d' % (last.published_on.isoformat(), last.id)
+            )
+        Article.prefetch_translations(articles)
+        return surrogate_response(
+            unicode(render_template(
+                'article-author.jinja', author=user, articles=articles,
+                next_page=next_page,
+            )),
+            [Article.list_surrogate_key()]
+        )
+
+    def _feed_artifact_key(self):
+        return _request_artifact_key('article-author-feed', self.id)
+
+    def _feed_job(self):
+        return {
+            'key': 'article-author-feed:%d' % self.id,
+            'model': self.__name__,
+            'method': 'generate_atom_feed',
+            'record': self.id,
+            'needs_request': True,
+        }
+
+    def build_atom_feed(self):
+        """
+        Return the atom feed of the articles published by the user
+        """
+        Article = Pool().get('nereid.cms.article')
+
+        articles = Article.search([
+            ('author', '=', self.id),
+            ('state', '=', 'published'),
+        ])
+
         feed = AtomFeed(
-            "Articles by Author %s" % cls(id).display_name,
-            feed_url=request.url, url=request.host_url
+            "Articles by Author %s" % self.display_name,
+            feed_url=url_for(
+                'nereid.user.atom_feed', id=self.id, _external=True
+            ),
+            url=request.host_url
         )
+        Article.prefetch_translations(articles)
         for article in articles:
             feed.add(**article.serialize(purpose='atom'))
+        return feed.to_string()
 
-        return feed.get_response()
+    @classmethod
+    def generate_atom_feed(cls, user_id):
+        """
+        Store the atom feed of the user as an artifact. Run by the artifact
+        jobs.
+        """
+        Artifact = Pool().get('nereid.cms.artifact')
+
+        user = cls(user_id)
+        Artifact.generate(
+            user._feed_artifact_key(), user.build_atom_feed,
+            resource=str(user)
+        )
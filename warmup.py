@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+'''
+
+    Nereid CMS Warm-up
+    warmup.py
+
+    Fill the caches of a worker with the CMS data of every language before it
+    serves its first requests: the translations of menus, article categories,
+    published banners and the most recent articles, the uri lookups of those
+    articles, the banner samplers and the URL maps of the websites.
+
+    Call `warm_up` at worker boot with the nereid application, or run the
+    command line entry point after a deploy to generate the missing article
+    html artifacts (the only caches shared by all the workers)::
+
+        python -m trytond.modules.nereid_cms.warmup -c trytond.conf -d db
+
+'''
+import logging
+import argparse
+from multiprocessing.pool import ThreadPool
+
+from trytond.config import config
+from trytond.pool import Pool
+from trytond.transaction import Transaction
+
+__all__ = ['warm_up']
+
+logger = logging.getLogger('nereid_cms.warmup')
+
+
+def _warm_up_records(pool, articles):
+    """
+    Fill the caches of the CMS records which depend on the language of the
+    transaction: the translations of menus, categories, published banners and
+    the most recent articles, the uri lookups of those articles, and their
+    missing html artifacts
+    """
+    MenuItem = pool.get('nereid.cms.menuitem')
+    ArticleCategory = pool.get('nereid.cms.article.category')
+    Banner = pool.get('nereid.cms.banner')
+    Article = pool.get('nereid.cms.article')
+    Artifact = pool.get('nereid.cms.artifact')
+
+    MenuItem.prefetch_translations(MenuItem.search([]))
+    ArticleCategory.prefetch_translations(ArticleCategory.search([]))
+    Banner.prefetch_translations(Banner.search([
+        ('state', '=', 'published'),
+    ]))
+
+    recent = Article.search(
+        [('state', '=', 'published')],
+        order=[('published_on', 'DESC'), ('id', 'DESC')], limit=articles
+    )
+    Article.prefetch_translations(recent)
+    for article in recent:
+        Article.get_id_from_uri(article.uri)
+        if Artifact.get_content(article._html_artifact_key()) is None:
+            Artifact.store(
+                article._html_artifact_key(), article.render_content(),
+                resource=str(article)
+            )
+
+
+def _warm_up_shared(pool, app):
+    """
+    Fill the caches which do not depend on the language: the banner samplers
+    and, with the nereid application, the URL maps of the websites
+    """
+    BannerCategory = pool.get('nereid.cms.banner.category')
+    Website = pool.get('nereid.website')
+
+    for category in BannerCategory.search([]):
+        category.get_sampler()
+    if app is not None:
+        for website in Website.search([]):
+            website.get_url_adapter(app)
+
+
+def _warm_up_language(database_name, user, language, articles):
+    with Transaction().start(
+            database_name, user, context={'language': language}
+    ) as transaction:
+        _warm_up_records(Pool(database_name), articles)
+        transaction.cursor.commit()
+
+
+def warm_up(database_name, user, app=None, articles=20, processes=None):
+    """
+    Warm up the CMS caches of the database for every translatable language,
+    one language per thread of a pool of `processes` threads (one per
+    language by default).
+
+    The `articles` most recent published articles get their html generated.
+    The URL maps of the websites are only built when the nereid application
+    is given.
+    """
+    with Transaction().start(database_name, user):
+        pool = Pool(database_name)
+        Language = pool.get('ir.lang')
+        languages = [
+            language.code for language in Language.search([
+                ('translatable', '=', True),
+            ])
+        ]
+        _warm_up_shared(pool, app)
+
+    thread_pool = ThreadPool(processes or len(languages) or 1)
+    try:
+        results = [
+            thread_pool.apply_async(
+                _warm_up_language,
+                (database_name, user, language, articles)
+            ) for language in languages
+        ]
+        for language, result in zip(languages, results):
+            try:
+                result.get()
+            except Exception:
+                logger.exception('Warm-up failed for %s', language)
+    finally:
+        thread_pool.close()
+        thread_pool.join()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Warm up the CMS caches')
+    parser.add_argument('-c', '--config', dest='config', required=True)
+    parser.add_argument('-d', '--database', dest='database', required=True)
+    parser.add_argument('-u', '--user', dest='user', type=int, default=0)
+    parser.add_argument(
+        '-n', '--articles', dest='articles', type=int, default=20,
+        help='Number of recent articles to render'
+    )
+    options = parser.parse_args(args)
+
+    config.update_etc(options.config)
+    Pool(options.database).init()
+    warm_up(options.database, options.user, articles=options.articles)
+
+
+if __name__ == '__main__':
+    main()